@@ -0,0 +1,12 @@
+-- Búsqueda de empleados (buscar_empleado) con índice trigram
+-- La expresión del índice debe coincidir exactamente con la del WHERE
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS empleados_busqueda_trgm
+    ON empleados
+    USING gin ((
+        coalesce(codigo_empleado, '') || ' ' ||
+        coalesce(nombre, '') || ' ' ||
+        coalesce(apellido, '')
+    ) gin_trgm_ops);
@@ -0,0 +1,6 @@
+-- Nombre completo calculado al escribir el empleado, no en cada consulta
+-- Requerido por las herramientas (e.nombre_completo); PostgreSQL 12+
+
+ALTER TABLE empleados
+    ADD COLUMN IF NOT EXISTS nombre_completo text
+    GENERATED ALWAYS AS (nombre || ' ' || apellido) STORED;
@@ -0,0 +1,7 @@
+-- Último registro de un empleado (obtener_ultimo_registro): el ORDER BY
+-- fecha DESC, hora DESC LIMIT 1 se resuelve leyendo la primera entrada
+-- del índice, sin ordenar todos los registros del empleado
+
+CREATE INDEX IF NOT EXISTS registros_emp_fecha_hora
+    ON registros (empleado_id, fecha_registro DESC, hora_registro DESC)
+    INCLUDE (tipo_registro, punto_trabajo);
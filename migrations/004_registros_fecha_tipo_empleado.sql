@@ -0,0 +1,5 @@
+-- Empleados sin salida (empleados_sin_salida): las ENTRADAs del día y el
+-- anti-join NOT EXISTS contra las SALIDAs se resuelven con el mismo índice
+
+CREATE INDEX IF NOT EXISTS registros_fecha_tipo_emp
+    ON registros (fecha_registro, tipo_registro, empleado_id);
@@ -0,0 +1,6 @@
+-- Listado de empleados activos (consultar_empleados por defecto): índice
+-- parcial en el orden del ORDER BY apellido, nombre
+
+CREATE INDEX IF NOT EXISTS empleados_activos
+    ON empleados (apellido, nombre)
+    WHERE activo = TRUE;
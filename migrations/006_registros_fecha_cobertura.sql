@@ -0,0 +1,12 @@
+-- Registros de una fecha (consultar_registros_fecha y rangos cortos) y
+-- emparejamiento de entradas y salidas (nómina, reportes semanal y mensual):
+-- índice de cobertura en el orden (fecha, empleado, hora) de la ventana, con
+-- el resto de columnas de registros que devuelven las consultas, para
+-- resolverlas con index-only scan sin visitar el heap.
+-- El index-only scan depende del visibility map: después de crear el
+-- índice conviene ejecutar VACUUM ANALYZE registros.
+
+CREATE INDEX IF NOT EXISTS registros_fecha_emp_cover
+    ON registros (fecha_registro, empleado_id, hora_registro)
+    INCLUDE (id, tipo_registro, punto_trabajo,
+             confianza_reconocimiento, observaciones);
@@ -0,0 +1,7 @@
+-- Marca de registro forzado calculada al escribir el registro, no en cada
+-- consulta de estadísticas. Requerido por estadisticas_asistencia
+-- (COUNT(*) FILTER (WHERE forzado)); PostgreSQL 12+
+
+ALTER TABLE registros
+    ADD COLUMN IF NOT EXISTS forzado boolean
+    GENERATED ALWAYS AS (observaciones LIKE '%FORZADO%') STORED;
@@ -0,0 +1,68 @@
+"""Caché opcional en Redis para consultas de alta frecuencia"""
+
+import os
+import time
+import logging
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Redis es opcional: sin él las tools consultan la BD
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se deja de usar Redis después de un fallo (circuit breaker)
+PAUSA_TRAS_FALLO = 30
+
+
+class Cache:
+    """Clase para manejar una caché async en Redis con degradación a la BD"""
+
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL")
+        self.client = None
+        self._abierto_hasta = 0.0
+
+    async def connect(self):
+        """Crea el cliente Redis si REDIS_URL está configurada"""
+        if not self.redis_url:
+            return
+        if redis is None:
+            logger.warning("REDIS_URL configurada pero el paquete redis no está instalado")
+            return
+        self.client = redis.from_url(
+            self.redis_url,
+            socket_timeout=0.25,
+            socket_connect_timeout=0.25
+        )
+
+    async def disconnect(self):
+        """Cierra el cliente Redis"""
+        if self.client:
+            await self.client.aclose()
+
+    def _disponible(self) -> bool:
+        return self.client is not None and time.monotonic() >= self._abierto_hasta
+
+    def _abrir_circuito(self, error: Exception):
+        logger.warning("Redis no disponible (%s), usando la base de datos", error)
+        self._abierto_hasta = time.monotonic() + PAUSA_TRAS_FALLO
+
+    async def get(self, clave: str) -> bytes | None:
+        """Obtiene un valor; None si no existe o Redis no está disponible"""
+        if not self._disponible():
+            return None
+        try:
+            return await self.client.get(clave)
+        except (redis.RedisError, OSError) as e:
+            self._abrir_circuito(e)
+            return None
+
+    async def set(self, clave: str, valor: bytes, ttl: int):
+        """Guarda un valor con expiración en segundos"""
+        if not self._disponible():
+            return
+        try:
+            await self.client.set(clave, valor, ex=ttl)
+        except (redis.RedisError, OSError) as e:
+            self._abrir_circuito(e)
@@ -1,13 +1,28 @@
 """Módulo de conexión a base de datos PostgreSQL async"""
 
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+import time
+import logging
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import event, text, TextClause
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Conexiones permanentes del pool: escala con los CPUs, con tope
+POOL_SIZE_DEFAULT = min(32, 2 * (os.cpu_count() or 1))
+
+
+def _uuid_como_texto(dbapi_connection, connection_record):
+    """Codec de asyncpg: los uuid llegan como str y no se convierten fila a fila"""
+    dbapi_connection.run_async(
+        lambda conn: conn.set_type_codec(
+            "uuid", encoder=str, decoder=str, schema="pg_catalog", format="text"
+        )
+    )
+
 
 class Database:
     """Clase para manejar conexiones async a PostgreSQL"""
@@ -21,35 +36,70 @@ class Database:
         )
         self.engine = None
         self.session_factory = None
+        # Caché en memoria de datos de referencia: clave -> (expira, valor)
+        self._rcache: dict[str, tuple[float, list[dict]]] = {}
 
     async def connect(self):
         """Establece conexión con la base de datos"""
         self.engine = create_async_engine(
             self.database_url,
             echo=False,
-            pool_size=5,
-            max_overflow=10
-        )
-        self.session_factory = sessionmaker(
-            self.engine,
-            class_=AsyncSession,
-            expire_on_commit=False
+            pool_size=int(os.getenv("DB_POOL_SIZE", POOL_SIZE_DEFAULT)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            # Descarta conexiones muertas (reinicio de la BD, timeouts de un
+            # proxy) al sacarlas del pool en vez de fallar el request
+            pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "1") == "1",
+            # Cache de prepared statements de asyncpg por conexión: cada
+            # consulta de las tools se parsea y planifica una sola vez
+            connect_args={
+                "prepared_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+            }
         )
+        event.listen(self.engine.sync_engine, "connect", _uuid_como_texto)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def warmup(self):
+        """Abre la primera conexión del pool para que no la pague el primer request"""
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.warning("No se pudo precalentar la conexión: %s", e)
 
     async def disconnect(self):
         """Cierra la conexión"""
         if self.engine:
             await self.engine.dispose()
 
-    async def execute(self, query: str, params: dict = None) -> list[dict]:
-        """Ejecuta una consulta y retorna resultados como lista de dicts"""
+    async def execute(self, query: str | TextClause, params: dict = None) -> list[dict]:
+        """Ejecuta una consulta (SQL o text() ya construido) y retorna lista de dicts"""
+        if isinstance(query, str):
+            query = text(query)
         async with self.session_factory() as session:
-            result = await session.execute(text(query), params or {})
+            result = await session.execute(query, params or {})
             rows = result.fetchall()
             columns = result.keys()
             return [dict(zip(columns, row)) for row in rows]
 
-    async def execute_one(self, query: str, params: dict = None) -> dict | None:
+    async def cached(self, clave: str, ttl: float, loader) -> list[dict]:
+        """Retorna el resultado de loader() cacheado en memoria por ttl segundos"""
+        ahora = time.monotonic()
+        entrada = self._rcache.get(clave)
+        if entrada is not None and entrada[0] > ahora:
+            return entrada[1]
+
+        valor = await loader()
+        self._rcache[clave] = (ahora + ttl, valor)
+        return valor
+
+    def invalidar_cache(self, clave: str | None = None):
+        """Descarta una entrada (o todos) los datos de referencia cacheados"""
+        if clave is None:
+            self._rcache.clear()
+        else:
+            self._rcache.pop(clave, None)
+
+    async def execute_one(self, query: str | TextClause, params: dict = None) -> dict | None:
         """Ejecuta una consulta y retorna un solo resultado"""
         results = await self.execute(query, params)
         return results[0] if results else None
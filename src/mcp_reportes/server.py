@@ -1,57 +1,98 @@
 """Servidor MCP para Reportes de Control de Acceso con Streamable HTTP"""
 
 import os
-import json
+import sys
+import time
+import asyncio
+import logging
 import contextlib
-from mcp.server.fastmcp import FastMCP
+from types import MappingProxyType
+import orjson
+import fastjsonschema
 from starlette.applications import Starlette
 from starlette.routing import Route
 from starlette.requests import Request
-from starlette.responses import JSONResponse
-import uvicorn
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from .database import Database
+from .cache import Cache
 from .tools import empleados, registros, reportes, nomina
 
+logger = logging.getLogger(__name__)
+
 # Instancia de base de datos
 db = Database()
 
-# Crear servidor MCP (solo para stdio mode y definición de tools)
-mcp = FastMCP("mcp-reportes-acceso")
+# Caché Redis opcional (REDIS_URL) para consultas muy consultadas
+cache = Cache()
+
+# Segundos que se cachea el último registro de un empleado
+ULTIMO_REGISTRO_TTL = 10
+
+def _dumps(result) -> str:
+    """Serializa el resultado de una tool como JSON compacto UTF-8"""
+    return orjson.dumps(result, default=str).decode()
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse serializada con orjson"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+async def _obtener_ultimo_registro(db, empleado_id: str) -> dict:
+    """Último registro del empleado, servido desde Redis si está en caché"""
+    clave = f"ultimo_registro:{empleado_id}"
+    cached = await cache.get(clave)
+    if cached is not None:
+        return orjson.loads(cached)
+
+    result = await registros.obtener_ultimo_registro(db, empleado_id=empleado_id)
+    await cache.set(clave, orjson.dumps(result, default=str), ttl=ULTIMO_REGISTRO_TTL)
+    return result
+
+
+async def _llamar_tool(nombre: str, /, **args):
+    """Ejecuta una tool del TOOL_REGISTRY (camino común de stdio y HTTP)"""
+    t0 = time.perf_counter() if logger.isEnabledFor(logging.DEBUG) else 0
+    result = await TOOL_REGISTRY[nombre](db, **args)
+    if t0:
+        logger.debug("Tool %s ejecutada en %.3f ms", nombre, (time.perf_counter() - t0) * 1000)
+    return result
 
 
 # === HERRAMIENTAS DE EMPLEADOS ===
 
-@mcp.tool()
 async def consultar_empleados(
     activos_solo: bool = True,
     restaurante: str | None = None,
     departamento: str | None = None
 ) -> str:
     """Lista empleados del sistema con filtros opcionales por restaurante y departamento"""
-    result = await empleados.consultar_empleados(
-        db,
+    result = await _llamar_tool(
+        "consultar_empleados",
         activos_solo=activos_solo,
         restaurante=restaurante,
         departamento=departamento
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def buscar_empleado(termino: str) -> str:
     """Busca empleados por código, nombre o apellido"""
-    result = await empleados.buscar_empleado(db, termino=termino)
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    result = await _llamar_tool("buscar_empleado", termino=termino)
+    return _dumps(result)
 
 
 # === HERRAMIENTAS DE REGISTROS ===
 
-@mcp.tool()
 async def consultar_registros_fecha(
     fecha: str,
     empleado_id: str | None = None,
     restaurante: str | None = None,
-    tipo: str | None = None
+    tipo: str | None = None,
+    por_pagina: int | None = None,
+    cursor: str | None = None
 ) -> str:
     """Consulta registros de entrada/salida de una fecha específica.
 
@@ -60,23 +101,29 @@ async def consultar_registros_fecha(
         empleado_id: ID del empleado (opcional)
         restaurante: Filtrar por restaurante (opcional)
         tipo: Tipo de registro: ENTRADA o SALIDA (opcional)
+        por_pagina: Máximo de registros por página (opcional)
+        cursor: siguiente_cursor de la página anterior (opcional)
     """
-    result = await registros.consultar_registros_fecha(
-        db,
+    result = await _llamar_tool(
+        "consultar_registros_fecha",
         fecha=fecha,
         empleado_id=empleado_id,
         restaurante=restaurante,
-        tipo=tipo
+        tipo=tipo,
+        por_pagina=por_pagina,
+        cursor=cursor
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def consultar_registros_rango(
     fecha_inicio: str,
     fecha_fin: str,
     empleado_id: str | None = None,
-    restaurante: str | None = None
+    restaurante: str | None = None,
+    columnas: bool = False,
+    por_pagina: int | None = None,
+    cursor: str | None = None
 ) -> str:
     """Consulta registros en un rango de fechas.
 
@@ -85,38 +132,47 @@ async def consultar_registros_rango(
         fecha_fin: Fecha final en formato YYYY-MM-DD
         empleado_id: ID del empleado (opcional)
         restaurante: Filtrar por restaurante (opcional)
+        columnas: Devolver los registros como una lista por campo (opcional)
+        por_pagina: Máximo de registros por página (opcional)
+        cursor: siguiente_cursor de la página anterior (opcional)
     """
-    result = await registros.consultar_registros_rango(
-        db,
+    result = await _llamar_tool(
+        "consultar_registros_rango",
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
         empleado_id=empleado_id,
-        restaurante=restaurante
+        restaurante=restaurante,
+        columnas=columnas,
+        por_pagina=por_pagina,
+        cursor=cursor
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def obtener_ultimo_registro(empleado_id: str) -> str:
     """Obtiene el último registro de un empleado"""
-    result = await registros.obtener_ultimo_registro(db, empleado_id=empleado_id)
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    result = await _llamar_tool("obtener_ultimo_registro", empleado_id=empleado_id)
+    return _dumps(result)
+
+
+async def obtener_ultimos_registros(empleado_ids: list[str]) -> str:
+    """Obtiene el último registro de varios empleados en una sola consulta"""
+    result = await _llamar_tool("obtener_ultimos_registros", empleado_ids=empleado_ids)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def empleados_sin_salida(fecha: str | None = None) -> str:
     """Lista empleados con entrada pero sin salida en una fecha.
 
     Args:
         fecha: Fecha en formato YYYY-MM-DD (opcional, default: hoy)
     """
-    result = await registros.empleados_sin_salida(db, fecha=fecha)
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    result = await _llamar_tool("empleados_sin_salida", fecha=fecha)
+    return _dumps(result)
 
 
 # === HERRAMIENTAS DE REPORTES ===
 
-@mcp.tool()
 async def calcular_horas_trabajadas_dia(empleado_id: str, fecha: str) -> str:
     """Calcula horas trabajadas de un empleado en un día con desglose de extras.
 
@@ -124,15 +180,14 @@ async def calcular_horas_trabajadas_dia(empleado_id: str, fecha: str) -> str:
         empleado_id: ID del empleado
         fecha: Fecha en formato YYYY-MM-DD
     """
-    result = await reportes.calcular_horas_trabajadas_dia(
-        db,
+    result = await _llamar_tool(
+        "calcular_horas_trabajadas_dia",
         empleado_id=empleado_id,
         fecha=fecha
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def reporte_horas_semanal(
     empleado_id: str | None = None,
     fecha_semana: str | None = None,
@@ -145,16 +200,15 @@ async def reporte_horas_semanal(
         fecha_semana: Cualquier fecha de la semana en formato YYYY-MM-DD (opcional)
         restaurante: Filtrar por restaurante (opcional)
     """
-    result = await reportes.reporte_horas_semanal(
-        db,
+    result = await _llamar_tool(
+        "reporte_horas_semanal",
         empleado_id=empleado_id,
         fecha_semana=fecha_semana,
         restaurante=restaurante
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def reporte_horas_mensual(
     anio: int,
     mes: int,
@@ -169,17 +223,16 @@ async def reporte_horas_mensual(
         empleado_id: ID del empleado (opcional)
         restaurante: Filtrar por restaurante (opcional)
     """
-    result = await reportes.reporte_horas_mensual(
-        db,
+    result = await _llamar_tool(
+        "reporte_horas_mensual",
         anio=anio,
         mes=mes,
         empleado_id=empleado_id,
         restaurante=restaurante
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def estadisticas_asistencia(
     fecha_inicio: str,
     fecha_fin: str,
@@ -192,29 +245,27 @@ async def estadisticas_asistencia(
         fecha_fin: Fecha final en formato YYYY-MM-DD
         restaurante: Filtrar por restaurante (opcional)
     """
-    result = await reportes.estadisticas_asistencia(
-        db,
+    result = await _llamar_tool(
+        "estadisticas_asistencia",
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
         restaurante=restaurante
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
 
 
-@mcp.tool()
 async def obtener_configuracion(clave: str | None = None) -> str:
     """Obtiene configuraciones del sistema para nómina.
 
     Args:
         clave: Clave de configuración específica (opcional)
     """
-    result = await reportes.obtener_configuracion(db, clave=clave)
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    result = await _llamar_tool("obtener_configuracion", clave=clave)
+    return _dumps(result)
 
 
 # === HERRAMIENTAS DE NÓMINA ===
 
-@mcp.tool()
 async def resumen_nomina_quincenal(
     anio: int,
     mes: int,
@@ -229,99 +280,81 @@ async def resumen_nomina_quincenal(
         quincena: Quincena (1 o 2)
         restaurante: Filtrar por restaurante (opcional)
     """
-    result = await nomina.resumen_nomina_quincenal(
-        db,
+    result = await _llamar_tool(
+        "resumen_nomina_quincenal",
         anio=anio,
         mes=mes,
         quincena=quincena,
         restaurante=restaurante
     )
-    return json.dumps(result, default=str, ensure_ascii=False, indent=2)
+    return _dumps(result)
+
+
+# Tools expuestas por FastMCP en modo stdio
+STDIO_TOOLS = (
+    consultar_empleados,
+    buscar_empleado,
+    consultar_registros_fecha,
+    consultar_registros_rango,
+    obtener_ultimo_registro,
+    obtener_ultimos_registros,
+    empleados_sin_salida,
+    calcular_horas_trabajadas_dia,
+    reporte_horas_semanal,
+    reporte_horas_mensual,
+    estadisticas_asistencia,
+    obtener_configuracion,
+    resumen_nomina_quincenal,
+)
+
+
+def create_mcp_server():
+    """Crea el servidor FastMCP para stdio (el modo HTTP no lo necesita)"""
+    from mcp.server.fastmcp import FastMCP
+
+    mcp = FastMCP("mcp-reportes-acceso")
+    for tool in STDIO_TOOLS:
+        mcp.add_tool(tool)
+    return mcp
+
+
+# Respuesta estática del health check, serializada una sola vez
+_HEALTH_BYTES = orjson.dumps({
+    "status": "healthy",
+    "server": "mcp-reportes-acceso",
+    "version": "2.0.0",
+    "transport": "streamable-http"
+})
 
 
 async def health_check(request):
     """Health check endpoint"""
-    return JSONResponse({
-        "status": "healthy",
-        "server": "mcp-reportes-acceso",
-        "version": "2.0.0",
-        "transport": "streamable-http"
-    })
+    return Response(_HEALTH_BYTES, media_type="application/json")
 
 
 # ============================================================================
 # Manual Streamable HTTP Handler (bypasses DNS rebinding protection issues)
 # ============================================================================
 
-# Registry of tool functions for direct invocation
+# Registry of tool functions for direct invocation: fn(db, **arguments)
 TOOL_REGISTRY = {
-    "consultar_empleados": lambda args: empleados.consultar_empleados(
-        db,
-        activos_solo=args.get("activos_solo", True),
-        restaurante=args.get("restaurante"),
-        departamento=args.get("departamento")
-    ),
-    "buscar_empleado": lambda args: empleados.buscar_empleado(
-        db, termino=args.get("termino", "")
-    ),
-    "consultar_registros_fecha": lambda args: registros.consultar_registros_fecha(
-        db,
-        fecha=args.get("fecha", ""),
-        empleado_id=args.get("empleado_id"),
-        restaurante=args.get("restaurante"),
-        tipo=args.get("tipo")
-    ),
-    "consultar_registros_rango": lambda args: registros.consultar_registros_rango(
-        db,
-        fecha_inicio=args.get("fecha_inicio", ""),
-        fecha_fin=args.get("fecha_fin", ""),
-        empleado_id=args.get("empleado_id"),
-        restaurante=args.get("restaurante")
-    ),
-    "obtener_ultimo_registro": lambda args: registros.obtener_ultimo_registro(
-        db, empleado_id=args.get("empleado_id", "")
-    ),
-    "empleados_sin_salida": lambda args: registros.empleados_sin_salida(
-        db, fecha=args.get("fecha")
-    ),
-    "calcular_horas_trabajadas_dia": lambda args: reportes.calcular_horas_trabajadas_dia(
-        db,
-        empleado_id=args.get("empleado_id", ""),
-        fecha=args.get("fecha", "")
-    ),
-    "reporte_horas_semanal": lambda args: reportes.reporte_horas_semanal(
-        db,
-        empleado_id=args.get("empleado_id"),
-        fecha_semana=args.get("fecha_semana"),
-        restaurante=args.get("restaurante")
-    ),
-    "reporte_horas_mensual": lambda args: reportes.reporte_horas_mensual(
-        db,
-        anio=args.get("anio", 2025),
-        mes=args.get("mes", 1),
-        empleado_id=args.get("empleado_id"),
-        restaurante=args.get("restaurante")
-    ),
-    "estadisticas_asistencia": lambda args: reportes.estadisticas_asistencia(
-        db,
-        fecha_inicio=args.get("fecha_inicio", ""),
-        fecha_fin=args.get("fecha_fin", ""),
-        restaurante=args.get("restaurante")
-    ),
-    "obtener_configuracion": lambda args: reportes.obtener_configuracion(
-        db, clave=args.get("clave")
-    ),
-    "resumen_nomina_quincenal": lambda args: nomina.resumen_nomina_quincenal(
-        db,
-        anio=args.get("anio", 2025),
-        mes=args.get("mes", 1),
-        quincena=args.get("quincena", 1),
-        restaurante=args.get("restaurante")
-    ),
+    "consultar_empleados": empleados.consultar_empleados,
+    "buscar_empleado": empleados.buscar_empleado,
+    "consultar_registros_fecha": registros.consultar_registros_fecha,
+    "consultar_registros_rango": registros.consultar_registros_rango,
+    "obtener_ultimo_registro": _obtener_ultimo_registro,
+    "obtener_ultimos_registros": registros.obtener_ultimos_registros,
+    "empleados_sin_salida": registros.empleados_sin_salida,
+    "calcular_horas_trabajadas_dia": reportes.calcular_horas_trabajadas_dia,
+    "reporte_horas_semanal": reportes.reporte_horas_semanal,
+    "reporte_horas_mensual": reportes.reporte_horas_mensual,
+    "estadisticas_asistencia": reportes.estadisticas_asistencia,
+    "obtener_configuracion": reportes.obtener_configuracion,
+    "resumen_nomina_quincenal": nomina.resumen_nomina_quincenal,
 }
 
-# Tool definitions for tools/list response
-TOOL_DEFINITIONS = [
+# Tool definitions for tools/list response (inmutables: ya se serializan al importar)
+TOOL_DEFINITIONS = tuple(MappingProxyType(d) for d in [
     {
         "name": "consultar_empleados",
         "description": "Lista empleados del sistema con filtros opcionales por restaurante y departamento",
@@ -354,7 +387,9 @@ TOOL_DEFINITIONS = [
                 "fecha": {"type": "string", "description": "Fecha en formato YYYY-MM-DD"},
                 "empleado_id": {"type": "string", "description": "ID del empleado"},
                 "restaurante": {"type": "string", "description": "Filtrar por restaurante"},
-                "tipo": {"type": "string", "description": "Tipo de registro: ENTRADA o SALIDA"}
+                "tipo": {"type": "string", "description": "Tipo de registro: ENTRADA o SALIDA"},
+                "por_pagina": {"type": "integer", "minimum": 1, "description": "Máximo de registros por página"},
+                "cursor": {"type": "string", "description": "siguiente_cursor de la página anterior"}
             },
             "required": ["fecha"]
         }
@@ -368,7 +403,10 @@ TOOL_DEFINITIONS = [
                 "fecha_inicio": {"type": "string", "description": "Fecha inicial YYYY-MM-DD"},
                 "fecha_fin": {"type": "string", "description": "Fecha final YYYY-MM-DD"},
                 "empleado_id": {"type": "string", "description": "ID del empleado"},
-                "restaurante": {"type": "string", "description": "Filtrar por restaurante"}
+                "restaurante": {"type": "string", "description": "Filtrar por restaurante"},
+                "columnas": {"type": "boolean", "default": False, "description": "Registros como una lista por campo en vez de una lista de filas"},
+                "por_pagina": {"type": "integer", "minimum": 1, "description": "Máximo de registros por página"},
+                "cursor": {"type": "string", "description": "siguiente_cursor de la página anterior"}
             },
             "required": ["fecha_inicio", "fecha_fin"]
         }
@@ -384,6 +422,17 @@ TOOL_DEFINITIONS = [
             "required": ["empleado_id"]
         }
     },
+    {
+        "name": "obtener_ultimos_registros",
+        "description": "Obtiene el último registro de varios empleados en una sola consulta",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "empleado_ids": {"type": "array", "items": {"type": "string"}, "minItems": 1, "description": "IDs de los empleados"}
+            },
+            "required": ["empleado_ids"]
+        }
+    },
     {
         "name": "empleados_sin_salida",
         "description": "Lista empleados con entrada pero sin salida en una fecha",
@@ -469,7 +518,153 @@ TOOL_DEFINITIONS = [
             "required": ["anio", "mes", "quincena"]
         }
     },
-]
+])
+
+# TOOL_DEFINITIONS es la única fuente de los schemas; debe cubrir el registry
+if [d["name"] for d in TOOL_DEFINITIONS] != list(TOOL_REGISTRY):
+    raise RuntimeError("TOOL_DEFINITIONS y TOOL_REGISTRY no coinciden")
+
+# Validadores de argumentos compilados una vez a partir de los inputSchema
+_VALIDATORS = {d["name"]: fastjsonschema.compile(d["inputSchema"]) for d in TOOL_DEFINITIONS}
+
+# Parámetros declarados por tool: los argumentos extra se ignoran, como antes
+_PARAMETROS = {d["name"]: frozenset(d["inputSchema"]["properties"]) for d in TOOL_DEFINITIONS}
+
+# Payloads estáticos serializados una sola vez; por request solo se agrega
+# el id del mensaje. Se cachean los bytes y no los objetos Response porque
+# los middlewares (CORS, GZip) modifican los headers de la respuesta.
+_SERVER_INFO = {
+    "protocolVersion": "2024-11-05",
+    "serverInfo": {
+        "name": "mcp-reportes-acceso",
+        "version": "2.0.0"
+    },
+    "capabilities": {
+        "tools": {}
+    }
+}
+_DISCOVERY_BYTES = orjson.dumps({"jsonrpc": "2.0", "result": _SERVER_INFO})
+_INITIALIZE_RESULT = orjson.dumps(_SERVER_INFO)
+_TOOLS_LIST_RESULT = orjson.dumps({"tools": TOOL_DEFINITIONS}, default=dict)
+_EMPTY_RESULT = b'{}'
+_NOTIFY_ACK_BYTES = b'{"jsonrpc":"2.0","result":{}}'
+
+
+def _rpc_result(msg_id, result: bytes) -> Response:
+    """Respuesta JSON-RPC con un resultado ya serializado"""
+    payload = b'{"jsonrpc":"2.0","id":' + orjson.dumps(msg_id) + b',"result":' + result + b'}'
+    return Response(payload, media_type="application/json")
+
+
+# Resultados con listas de al menos estas filas se transmiten por partes
+STREAM_MIN_FILAS = 500
+STREAM_BLOQUE = 256
+
+
+def _es_grande(result) -> bool:
+    """True si el resultado tiene alguna lista de STREAM_MIN_FILAS filas o más"""
+    return isinstance(result, dict) and any(
+        isinstance(v, list) and len(v) >= STREAM_MIN_FILAS for v in result.values()
+    )
+
+
+def _iter_json(result: dict):
+    """Serializa el dict igual que _dumps pero por partes (listas en bloques)"""
+    yield b'{'
+    for i, (clave, valor) in enumerate(result.items()):
+        yield (b',' if i else b'') + orjson.dumps(clave) + b':'
+        if isinstance(valor, list) and len(valor) >= STREAM_MIN_FILAS:
+            yield b'['
+            for k in range(0, len(valor), STREAM_BLOQUE):
+                bloque = b','.join(orjson.dumps(f, default=str) for f in valor[k:k + STREAM_BLOQUE])
+                yield (b',' if k else b'') + bloque
+            yield b']'
+        else:
+            yield orjson.dumps(valor, default=str)
+    yield b'}'
+
+
+async def _stream_tool(msg_id, result: dict):
+    """Respuesta de tools/call con el texto del resultado emitido por partes"""
+    yield b'{"jsonrpc":"2.0","id":' + orjson.dumps(msg_id) + b',"result":{"content":[{"type":"text","text":"'
+    for parte in _iter_json(result):
+        # Escapar cada parte como string JSON equivale a escapar el texto completo
+        yield orjson.dumps(parte.decode())[1:-1]
+    yield b'"}]}}'
+
+
+def _rpc_error(msg_id, code: int, message: str) -> ORJSONResponse:
+    """Respuesta JSON-RPC de error"""
+    return ORJSONResponse({
+        "jsonrpc": "2.0",
+        "id": msg_id,
+        "error": {"code": code, "message": message}
+    })
+
+
+async def _handle_initialize(request: Request, msg_id, params: dict):
+    logger.debug("[Streamable HTTP] Initialize response sent")
+    return _rpc_result(msg_id, _INITIALIZE_RESULT)
+
+
+async def _handle_tools_list(request: Request, msg_id, params: dict):
+    logger.debug("[Streamable HTTP] Tools list: %d tools", len(TOOL_DEFINITIONS))
+    return _rpc_result(msg_id, _TOOLS_LIST_RESULT)
+
+
+async def _handle_tools_call(request: Request, msg_id, params: dict):
+    tool_name = params.get("name", "")
+    tool_args = params.get("arguments") or {}
+
+    logger.debug("[Streamable HTTP] Calling tool: %s", tool_name)
+
+    if tool_name not in TOOL_REGISTRY:
+        return _rpc_error(msg_id, -32601, f"Tool not found: {tool_name}")
+
+    # Los opcionales en null equivalen a omitirlos (default None); los
+    # argumentos que la tool no declara se descartan
+    parametros = _PARAMETROS[tool_name]
+    tool_args = {k: v for k, v in tool_args.items() if v is not None and k in parametros}
+    try:
+        _VALIDATORS[tool_name](tool_args)
+    except fastjsonschema.JsonSchemaException as e:
+        return _rpc_error(msg_id, -32602, f"Invalid params: {e.message}")
+
+    try:
+        # Call the tool function
+        result = await _llamar_tool(tool_name, **tool_args)
+
+        if _es_grande(result):
+            logger.debug("[Streamable HTTP] Tool %s executed successfully (streaming)", tool_name)
+            return StreamingResponse(
+                _stream_tool(msg_id, result),
+                media_type="application/json"
+            )
+
+        # Format result as JSON string
+        text_content = _dumps(result)
+
+        response = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "result": {
+                "content": [{"type": "text", "text": text_content}]
+            }
+        }
+        logger.debug("[Streamable HTTP] Tool %s executed successfully", tool_name)
+        return ORJSONResponse(response)
+
+    except Exception as e:
+        logger.exception("[Streamable HTTP] Tool error: %s", tool_name)
+        return _rpc_error(msg_id, -32000, str(e))
+
+
+# Métodos JSON-RPC soportados: un lookup en lugar de una cadena de if/elif
+_METHODS = {
+    "initialize": _handle_initialize,
+    "tools/list": _handle_tools_list,
+    "tools/call": _handle_tools_call,
+}
 
 
 async def handle_streamable_http(request: Request):
@@ -477,31 +672,21 @@ async def handle_streamable_http(request: Request):
     Handle Streamable HTTP MCP requests.
     This bypasses FastMCP's DNS rebinding protection for EasyPanel compatibility.
     """
-    import sys
-
     method = request.method
-    print(f"[Streamable HTTP] {method} /mcp", file=sys.stderr)
+    logger.debug("[Streamable HTTP] %s /mcp", method)
 
     if method == "GET":
         # Return server info for discovery
-        return JSONResponse({
-            "jsonrpc": "2.0",
-            "result": {
-                "protocolVersion": "2024-11-05",
-                "serverInfo": {
-                    "name": "mcp-reportes-acceso",
-                    "version": "2.0.0"
-                },
-                "capabilities": {
-                    "tools": {}
-                }
-            }
-        })
+        return Response(_DISCOVERY_BYTES, media_type="application/json")
 
     if method == "POST":
         try:
-            body = await request.json()
-            print(f"[Streamable HTTP] Request: {json.dumps(body)[:200]}", file=sys.stderr)
+            raw = await request.body()
+            logger.debug("[Streamable HTTP] Request: %s", raw[:200])
+            try:
+                body = orjson.loads(raw)
+            except orjson.JSONDecodeError as e:
+                return _rpc_error(None, -32700, f"Parse error: {e}")
 
             method_name = body.get("method", "")
             msg_id = body.get("id")
@@ -510,98 +695,23 @@ async def handle_streamable_http(request: Request):
             # Handle notifications (no response needed but n8n expects one)
             if method_name.startswith("notifications/"):
                 if msg_id is not None:
-                    return JSONResponse({
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "result": {}
-                    })
-                return JSONResponse({"jsonrpc": "2.0", "result": {}})
-
-            if method_name == "initialize":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "protocolVersion": "2024-11-05",
-                        "serverInfo": {
-                            "name": "mcp-reportes-acceso",
-                            "version": "2.0.0"
-                        },
-                        "capabilities": {
-                            "tools": {}
-                        }
-                    }
-                }
-                print(f"[Streamable HTTP] Initialize response sent", file=sys.stderr)
-                return JSONResponse(response)
-
-            elif method_name == "tools/list":
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {"tools": TOOL_DEFINITIONS}
-                }
-                print(f"[Streamable HTTP] Tools list: {len(TOOL_DEFINITIONS)} tools", file=sys.stderr)
-                return JSONResponse(response)
-
-            elif method_name == "tools/call":
-                tool_name = params.get("name", "")
-                tool_args = params.get("arguments", {})
-
-                print(f"[Streamable HTTP] Calling tool: {tool_name}", file=sys.stderr)
-
-                if tool_name not in TOOL_REGISTRY:
-                    return JSONResponse({
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "error": {"code": -32601, "message": f"Tool not found: {tool_name}"}
-                    })
-
-                try:
-                    # Call the tool function
-                    result = await TOOL_REGISTRY[tool_name](tool_args)
-
-                    # Format result as JSON string
-                    text_content = json.dumps(result, default=str, ensure_ascii=False, indent=2)
-
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "result": {
-                            "content": [{"type": "text", "text": text_content}]
-                        }
-                    }
-                    print(f"[Streamable HTTP] Tool {tool_name} executed successfully", file=sys.stderr)
-                    return JSONResponse(response)
-
-                except Exception as e:
-                    print(f"[Streamable HTTP] Tool error: {e}", file=sys.stderr)
-                    import traceback
-                    traceback.print_exc(file=sys.stderr)
-                    return JSONResponse({
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "error": {"code": -32000, "message": str(e)}
-                    })
-
-            else:
+                    return _rpc_result(msg_id, _EMPTY_RESULT)
+                return Response(_NOTIFY_ACK_BYTES, media_type="application/json")
+
+            handler = _METHODS.get(method_name)
+            if handler is None:
                 # Unknown method
-                return JSONResponse({
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "error": {"code": -32601, "message": f"Method not found: {method_name}"}
-                })
+                return _rpc_error(msg_id, -32601, f"Method not found: {method_name}")
+            return await handler(request, msg_id, params)
 
         except Exception as e:
-            print(f"[Streamable HTTP ERROR] {e}", file=sys.stderr)
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            return JSONResponse(
+            logger.exception("[Streamable HTTP ERROR] %s", e)
+            return ORJSONResponse(
                 {"jsonrpc": "2.0", "error": {"code": -32000, "message": str(e)}},
                 status_code=500
             )
 
-    return JSONResponse({"error": "Method not allowed"}, status_code=405)
+    return ORJSONResponse({"error": "Method not allowed"}, status_code=405)
 
 
 def create_starlette_app():
@@ -612,11 +722,17 @@ def create_starlette_app():
         """Maneja el ciclo de vida de la aplicación"""
         # Conectar base de datos
         await db.connect()
-        print("Base de datos conectada")
+        await cache.connect()
+        # El handshake con PostgreSQL corre en segundo plano mientras el
+        # servidor ya acepta requests (health checks incluidos)
+        calentamiento = asyncio.create_task(db.warmup())
+        logger.info("Base de datos conectada")
         yield
         # Desconectar base de datos
+        calentamiento.cancel()
+        await cache.disconnect()
         await db.disconnect()
-        print("Base de datos desconectada")
+        logger.info("Base de datos desconectada")
 
     app = Starlette(
         routes=[
@@ -627,28 +743,41 @@ def create_starlette_app():
         lifespan=lifespan,
     )
 
-    # Añadir CORS Middleware para permitir acceso desde ChatKit/Web
-    from starlette.middleware import Middleware
-    from starlette.middleware.cors import CORSMiddleware
-    
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
+    # Añadir CORS Middleware para permitir acceso desde ChatKit/Web, salvo
+    # que el reverse proxy (Traefik en EasyPanel) ya agregue los headers
+    if os.getenv("CORS_IN_PROXY") != "1":
+        from starlette.middleware.cors import CORSMiddleware
+
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+
+    # Comprimir respuestas grandes (reportes mensuales, estadísticas)
+    from starlette.middleware.gzip import GZipMiddleware
+
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
     return app
 
 
 def main():
     """Punto de entrada principal"""
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
     port = int(os.getenv("PORT", "8000"))
 
     if os.getenv("PORT"):
         # Modo Streamable HTTP para deployment
-        print(f"Iniciando servidor MCP con Streamable HTTP (puerto {port})")
+        logger.info("Iniciando servidor MCP con Streamable HTTP (puerto %s)", port)
+
+        # uvicorn solo se necesita en modo HTTP; stdio arranca sin importarlo
+        import uvicorn
 
         app = create_starlette_app()
 
@@ -656,12 +785,16 @@ def main():
             app,
             host="0.0.0.0",
             port=port,
-            log_level="info"
+            log_level="info",
+            # Event loop (libuv) y parser HTTP en C; uvloop no existe en Windows
+            loop="uvloop" if sys.platform != "win32" else "auto",
+            http="httptools",
+            access_log=False
         )
     else:
         # Modo stdio para Claude Desktop local
-        print("Iniciando servidor MCP en modo stdio")
-        mcp.run(transport="stdio")
+        logger.info("Iniciando servidor MCP en modo stdio")
+        create_mcp_server().run(transport="stdio")
 
 
 if __name__ == "__main__":
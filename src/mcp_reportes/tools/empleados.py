@@ -1,6 +1,57 @@
 """Herramientas MCP para consulta de empleados"""
 
 from typing import Optional
+from sqlalchemy import text
+
+_SQL_EMPLEADOS = """
+    SELECT
+        id,
+        codigo_empleado,
+        nombre_completo,
+        nombre,
+        apellido,
+        email,
+        telefono,
+        departamento,
+        cargo,
+        punto_trabajo,
+        liquida_dominical,
+        dia_descanso,
+        activo
+    FROM empleados
+    WHERE {filtro_activo}
+      (CAST(:restaurante AS text) IS NULL OR punto_trabajo = :restaurante)
+      AND (CAST(:departamento AS text) IS NULL OR departamento = :departamento)
+    ORDER BY apellido, nombre
+"""
+_Q_EMPLEADOS_ACTIVOS = text(_SQL_EMPLEADOS.format(filtro_activo="activo = TRUE AND"))
+_Q_EMPLEADOS_TODOS = text(_SQL_EMPLEADOS.format(filtro_activo=""))
+
+_Q_BUSCAR = text("""
+    SELECT
+        id,
+        codigo_empleado,
+        nombre_completo,
+        cargo,
+        departamento,
+        punto_trabajo,
+        activo
+    FROM empleados
+    -- Misma expresión que el índice empleados_busqueda_trgm (migrations/001)
+    WHERE (
+        coalesce(codigo_empleado, '') || ' ' ||
+        coalesce(nombre, '') || ' ' ||
+        coalesce(apellido, '')
+    ) ILIKE '%' || :termino || '%'
+    ORDER BY
+        CASE
+            WHEN codigo_empleado ILIKE :termino THEN 0
+            WHEN codigo_empleado ILIKE :termino || '%' THEN 1
+            ELSE 2
+        END,
+        apellido, nombre
+    LIMIT 20
+""")
 
 
 async def consultar_empleados(
@@ -21,54 +72,16 @@ async def consultar_empleados(
     Returns:
         Lista de empleados
     """
-    query = """
-        SELECT
-            id,
-            codigo_empleado,
-            nombre,
-            apellido,
-            email,
-            telefono,
-            departamento,
-            cargo,
-            liquida_dominical,
-            dia_descanso,
-            punto_trabajo,
-            activo,
-            created_at
-        FROM empleados
-        WHERE (:activo::boolean = FALSE OR activo = :activo)
-          AND (:restaurante::text IS NULL OR punto_trabajo = :restaurante)
-          AND (:departamento::text IS NULL OR departamento = :departamento)
-        ORDER BY apellido, nombre
-    """
+    # Activos: la condición literal activo = TRUE permite usar el índice
+    # parcial empleados_activos, que ya viene en el orden del ORDER BY
+    query = _Q_EMPLEADOS_ACTIVOS if activos_solo else _Q_EMPLEADOS_TODOS
     
     params = {
-        'activo': activos_solo,
         'restaurante': restaurante,
         'departamento': departamento
     }
     
-    results = await db.execute(query, params)
-    
-    # Formatear resultados
-    empleados = []
-    for row in results:
-        empleados.append({
-            'id': str(row['id']),
-            'codigo_empleado': row['codigo_empleado'],
-            'nombre_completo': f"{row['nombre']} {row['apellido']}",
-            'nombre': row['nombre'],
-            'apellido': row['apellido'],
-            'email': row['email'],
-            'telefono': row['telefono'],
-            'departamento': row['departamento'],
-            'cargo': row['cargo'],
-            'punto_trabajo': row['punto_trabajo'],
-            'liquida_dominical': row['liquida_dominical'],
-            'dia_descanso': row['dia_descanso'],
-            'activo': row['activo']
-        })
+    empleados = await db.execute(query, params)
     
     return {
         'total': len(empleados),
@@ -92,39 +105,7 @@ async def buscar_empleado(db, termino: str) -> list[dict]:
     Returns:
         Lista de empleados que coinciden
     """
-    query = """
-        SELECT
-            id,
-            codigo_empleado,
-            nombre,
-            apellido,
-            cargo,
-            departamento,
-            punto_trabajo,
-            activo
-        FROM empleados
-        WHERE codigo_empleado ILIKE '%' || :termino || '%'
-           OR nombre ILIKE '%' || :termino || '%'
-           OR apellido ILIKE '%' || :termino || '%'
-        ORDER BY
-            CASE WHEN codigo_empleado ILIKE :termino THEN 0 ELSE 1 END,
-            apellido, nombre
-        LIMIT 20
-    """
-    
-    results = await db.execute(query, {'termino': termino})
-    
-    empleados = []
-    for row in results:
-        empleados.append({
-            'id': str(row['id']),
-            'codigo_empleado': row['codigo_empleado'],
-            'nombre_completo': f"{row['nombre']} {row['apellido']}",
-            'cargo': row['cargo'],
-            'departamento': row['departamento'],
-            'punto_trabajo': row['punto_trabajo'],
-            'activo': row['activo']
-        })
+    empleados = await db.execute(_Q_BUSCAR, {'termino': termino})
     
     return {
         'termino_busqueda': termino,
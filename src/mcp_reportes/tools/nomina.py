@@ -1,9 +1,70 @@
 """Herramientas MCP para reportes de nómina"""
 
+import asyncio
 from typing import Optional
-from datetime import datetime
-from ..utils.fechas import get_quincena_range
-from ..utils.calculos import calcular_horas_dia, calcular_valor_horas
+from ..utils.fechas import MESES, get_quincena_range
+from ..utils.calculos import calcular_horas_intervalos, calcular_valor_horas
+from .reportes import Q_INTERVALOS, leer_configuracion
+
+def _calcular_empleado(data: dict, config: dict) -> dict:
+    """Horas, valores y detalle de días de un empleado en la quincena"""
+    horas = {
+        'ordinarias': 0,
+        'extra_diurna': 0,
+        'extra_nocturna': 0,
+        'recargo_nocturno': 0,
+        'dominical': 0
+    }
+    
+    detalle_dias = []
+    
+    for fecha_obj, pares in data['pares_por_fecha'].items():
+        fecha_str = str(fecha_obj)
+        horas_dia = calcular_horas_intervalos(pares, fecha_obj)
+    
+        horas['ordinarias'] += horas_dia['horas_ordinarias']
+        horas['extra_diurna'] += horas_dia['horas_extra_diurna']
+        horas['extra_nocturna'] += horas_dia['horas_extra_nocturna']
+        horas['recargo_nocturno'] += horas_dia['horas_recargo_nocturno']
+    
+        if data['liquida_dominical']:
+            horas['dominical'] += horas_dia['horas_dominical']
+    
+        # Detalle del día
+        if horas_dia['intervalos']:
+            detalle_dias.append({
+                'fecha': fecha_str,
+                'entrada': horas_dia['intervalos'][0]['entrada'] if horas_dia['intervalos'] else None,
+                'salida': horas_dia['intervalos'][-1]['salida'] if horas_dia['intervalos'] else None,
+                'horas': horas_dia['horas_trabajadas']
+            })
+    
+    # Redondear horas
+    for key in horas:
+        horas[key] = round(horas[key], 2)
+    
+    # Calcular valores monetarios
+    horas_para_calculo = {
+        'horas_ordinarias': horas['ordinarias'],
+        'horas_extra_diurna': horas['extra_diurna'],
+        'horas_extra_nocturna': horas['extra_nocturna'],
+        'horas_recargo_nocturno': horas['recargo_nocturno'],
+        'horas_dominical': horas['dominical'],
+        'es_domingo': False  # Se calcula por día
+    }
+    valores = calcular_valor_horas(horas_para_calculo, config)
+    
+    return {
+        'empleado_id': data['empleado_id'],
+        'codigo': data['codigo'],
+        'nombre': data['nombre'],
+        'cargo': data['cargo'],
+        'departamento': data['departamento'],
+        'dias_trabajados': len(data['pares_por_fecha']),
+        'horas': horas,
+        'valores': valores,
+        'detalle_dias': detalle_dias
+    }
 
 
 async def resumen_nomina_quincenal(
@@ -28,129 +89,46 @@ async def resumen_nomina_quincenal(
     """
     inicio, fin = get_quincena_range(anio, mes, quincena)
     
-    meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-             "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-    periodo = f"Quincena {quincena} - {meses[mes]} {anio}"
+    periodo = f"Quincena {quincena} - {MESES[mes]} {anio}"
     
-    # Obtener configuración de valores
-    config_query = """
-        SELECT clave, valor FROM configuracion
-        WHERE clave IN ('valor_hora_ordinaria', 'valor_hora_extra_diurna', 'valor_hora_extra_nocturna')
-    """
-    config_results = await db.execute(config_query, {})
+    # Configuración (compartida con obtener_configuracion, una sola entrada
+    # de caché) e intervalos son independientes: se consultan en paralelo
+    config_results, results = await asyncio.gather(
+        leer_configuracion(db),
+        # Mismo emparejamiento en SQL que los reportes de horas
+        db.execute(Q_INTERVALOS, {
+            'inicio': inicio,
+            'fin': fin,
+            'empleado_id': None,
+            'restaurante': restaurante
+        })
+    )
     config = {row['clave']: row['valor'] for row in config_results}
     
-    # Obtener registros de la quincena
-    query = """
-        SELECT
-            r.empleado_id,
-            e.codigo_empleado,
-            e.nombre || ' ' || e.apellido AS nombre,
-            e.cargo,
-            e.departamento,
-            e.liquida_dominical,
-            r.fecha_registro,
-            r.tipo_registro,
-            r.hora_registro,
-            r.observaciones
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE r.fecha_registro BETWEEN :inicio AND :fin
-          AND (:restaurante::text IS NULL OR r.punto_trabajo = :restaurante)
-          AND e.activo = TRUE
-        ORDER BY e.apellido, e.nombre, r.fecha_registro, r.hora_registro
-    """
-    
-    results = await db.execute(query, {
-        'inicio': str(inicio),
-        'fin': str(fin),
-        'restaurante': restaurante
-    })
-    
-    # Agrupar por empleado
+    # Agrupar intervalos por empleado y fecha
     empleados_data = {}
     for row in results:
-        emp_id = str(row['empleado_id'])
+        emp_id = row['empleado_id']
         if emp_id not in empleados_data:
             empleados_data[emp_id] = {
                 'empleado_id': emp_id,
                 'codigo': row['codigo_empleado'],
-                'nombre': row['nombre'],
+                'nombre': row['empleado_nombre'],
                 'cargo': row['cargo'],
                 'departamento': row['departamento'],
                 'liquida_dominical': row['liquida_dominical'],
-                'registros_por_fecha': {}
+                'pares_por_fecha': {}
             }
         
-        fecha = str(row['fecha_registro'])
-        if fecha not in empleados_data[emp_id]['registros_por_fecha']:
-            empleados_data[emp_id]['registros_por_fecha'][fecha] = []
-        
-        empleados_data[emp_id]['registros_por_fecha'][fecha].append({
-            'tipo_registro': row['tipo_registro'],
-            'hora_registro': row['hora_registro']
-        })
+        pares = empleados_data[emp_id]['pares_por_fecha'].setdefault(row['fecha_registro'], [])
+        if row['entrada'] is not None and row['salida'] is not None:
+            pares.append((row['entrada'], row['salida']))
     
-    # Calcular por empleado
-    reportes = []
-    for emp_id, data in empleados_data.items():
-        horas = {
-            'ordinarias': 0,
-            'extra_diurna': 0,
-            'extra_nocturna': 0,
-            'recargo_nocturno': 0,
-            'dominical': 0
-        }
-        
-        detalle_dias = []
-        
-        for fecha_str, registros in data['registros_por_fecha'].items():
-            fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-            horas_dia = calcular_horas_dia(registros, fecha_obj)
-            
-            horas['ordinarias'] += horas_dia['horas_ordinarias']
-            horas['extra_diurna'] += horas_dia['horas_extra_diurna']
-            horas['extra_nocturna'] += horas_dia['horas_extra_nocturna']
-            horas['recargo_nocturno'] += horas_dia['horas_recargo_nocturno']
-            
-            if data['liquida_dominical']:
-                horas['dominical'] += horas_dia['horas_dominical']
-            
-            # Detalle del día
-            if horas_dia['intervalos']:
-                detalle_dias.append({
-                    'fecha': fecha_str,
-                    'entrada': horas_dia['intervalos'][0]['entrada'] if horas_dia['intervalos'] else None,
-                    'salida': horas_dia['intervalos'][-1]['salida'] if horas_dia['intervalos'] else None,
-                    'horas': horas_dia['horas_trabajadas']
-                })
-        
-        # Redondear horas
-        for key in horas:
-            horas[key] = round(horas[key], 2)
-        
-        # Calcular valores monetarios
-        horas_para_calculo = {
-            'horas_ordinarias': horas['ordinarias'],
-            'horas_extra_diurna': horas['extra_diurna'],
-            'horas_extra_nocturna': horas['extra_nocturna'],
-            'horas_recargo_nocturno': horas['recargo_nocturno'],
-            'horas_dominical': horas['dominical'],
-            'es_domingo': False  # Se calcula por día
-        }
-        valores = calcular_valor_horas(horas_para_calculo, config)
-        
-        reportes.append({
-            'empleado_id': emp_id,
-            'codigo': data['codigo'],
-            'nombre': data['nombre'],
-            'cargo': data['cargo'],
-            'departamento': data['departamento'],
-            'dias_trabajados': len(data['registros_por_fecha']),
-            'horas': horas,
-            'valores': valores,
-            'detalle_dias': detalle_dias
-        })
+    # El cálculo es CPU puro: se hace en un hilo para no bloquear el event
+    # loop mientras se liquida toda la quincena
+    reportes = await asyncio.to_thread(
+        lambda: [_calcular_empleado(data, config) for data in empleados_data.values()]
+    )
     
     return {
         'periodo': periodo,
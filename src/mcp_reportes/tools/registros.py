@@ -1,15 +1,171 @@
 """Herramientas MCP para consulta de registros de entrada/salida"""
 
+import json
+import uuid
+import base64
 from typing import Optional
+from datetime import date, time
+from functools import lru_cache
+from sqlalchemy import text, TextClause
 from ..utils.fechas import get_current_date
 
+# Consultas construidas una sola vez con text(): cada llamada reutiliza el
+# mismo TextClause (sin re-parsear los bind params) y su entrada en el
+# caché de compilación de SQLAlchemy.
+_SELECT_REGISTROS_FECHA = """
+    SELECT
+        r.id,
+        r.empleado_id,
+        e.codigo_empleado,
+        e.nombre_completo AS empleado_nombre,
+        e.cargo,
+        e.departamento,
+        r.tipo_registro,
+        r.punto_trabajo,
+        r.fecha_registro,
+        r.hora_registro,
+        NULLIF(r.confianza_reconocimiento, 0)::float8 AS confianza,
+        r.observaciones
+    FROM registros r
+    JOIN empleados e ON r.empleado_id = e.id"""
+
+_SELECT_REGISTROS_RANGO = """
+    SELECT
+        r.id,
+        r.empleado_id,
+        e.codigo_empleado,
+        e.nombre_completo AS empleado_nombre,
+        r.tipo_registro,
+        r.punto_trabajo,
+        r.fecha_registro,
+        r.hora_registro,
+        r.observaciones
+    FROM registros r
+    JOIN empleados e ON r.empleado_id = e.id"""
+# Nombres de salida de _SELECT_REGISTROS_RANGO, en el mismo orden
+_COLUMNAS_RANGO = (
+    'id', 'empleado_id', 'codigo_empleado', 'empleado_nombre', 'tipo_registro',
+    'punto_trabajo', 'fecha_registro', 'hora_registro', 'observaciones'
+)
+
+# Condición de cada filtro opcional; solo se incluye si el filtro viene
+_FILTROS = {
+    'empleado_id': "r.empleado_id = CAST(:empleado_id AS uuid)",
+    'restaurante': "r.punto_trabajo = :restaurante",
+    'tipo': "r.tipo_registro = :tipo",
+}
+
+
+@lru_cache(maxsize=None)
+def _consulta_registros(
+    select: str,
+    condiciones: tuple[str, ...],
+    orden: str,
+    paginada: bool = False
+) -> TextClause:
+    """Arma (una vez por combinación de filtros) la consulta de registros"""
+    where = "\n      AND ".join(condiciones)
+    limite = "\n    LIMIT :limite" if paginada else ""
+    return text(f"{select}\n    WHERE {where}\n    ORDER BY {orden}{limite}\n")
+
+
+def _condiciones(filtro_fecha: str, params: dict) -> tuple[str, ...]:
+    """Filtro de fecha más las condiciones de los filtros presentes en params"""
+    return (filtro_fecha,) + tuple(
+        condicion for clave, condicion in _FILTROS.items()
+        if params.get(clave) is not None
+    )
+
+
+def _codificar_cursor(*clave) -> str:
+    """Cursor opaco con la clave de orden de la última fila de la página"""
+    return base64.urlsafe_b64encode(json.dumps([str(v) for v in clave]).encode()).decode()
+
+
+def _decodificar_cursor(cursor: str) -> list[str]:
+    """Clave de orden guardada en un cursor de _codificar_cursor"""
+    return json.loads(base64.urlsafe_b64decode(cursor))
+
+
+def _cortar_pagina(registros, total: int, por_pagina: Optional[int]):
+    """
+    Recorta a por_pagina filas un resultado leído con LIMIT por_pagina + 1.
+
+    Returns:
+        (total, última fila de la página o None si no hay más páginas)
+    """
+    if not por_pagina or total <= por_pagina:
+        return total, None
+    if isinstance(registros, dict):
+        for valores in registros.values():
+            del valores[por_pagina:]
+        return por_pagina, {campo: valores[-1] for campo, valores in registros.items()}
+    del registros[por_pagina:]
+    return por_pagina, registros[-1]
+
+
+_Q_ULTIMO_REGISTRO = text("""
+    SELECT
+        r.tipo_registro,
+        r.fecha_registro,
+        r.hora_registro,
+        r.punto_trabajo,
+        e.nombre_completo AS empleado_nombre
+    FROM registros r
+    JOIN empleados e ON r.empleado_id = e.id
+    WHERE r.empleado_id = CAST(:empleado_id AS uuid)
+    ORDER BY r.fecha_registro DESC, r.hora_registro DESC
+    LIMIT 1
+""")
+
+# Último registro de varios empleados en un solo round-trip: DISTINCT ON
+# recorre el índice (empleado_id, fecha DESC, hora DESC) una vez por empleado
+_Q_ULTIMOS_REGISTROS = text("""
+    SELECT DISTINCT ON (r.empleado_id)
+        r.empleado_id,
+        r.tipo_registro,
+        r.fecha_registro,
+        r.hora_registro,
+        r.punto_trabajo,
+        e.nombre_completo AS empleado_nombre
+    FROM registros r
+    JOIN empleados e ON r.empleado_id = e.id
+    WHERE r.empleado_id = ANY(CAST(:empleado_ids AS uuid[]))
+    ORDER BY r.empleado_id, r.fecha_registro DESC, r.hora_registro DESC
+""")
+
+_Q_SIN_SALIDA = text("""
+    SELECT
+        e.id AS empleado_id,
+        e.codigo_empleado,
+        e.nombre_completo AS empleado_nombre,
+        MIN(r.hora_registro) AS hora_entrada,
+        r.punto_trabajo,
+        EXTRACT(EPOCH FROM (NOW() - ((:fecha)::date + MIN(r.hora_registro)))) / 3600 AS horas_transcurridas
+    FROM registros r
+    JOIN empleados e ON r.empleado_id = e.id
+    WHERE r.fecha_registro = :fecha
+      AND r.tipo_registro = 'ENTRADA'
+      AND NOT EXISTS (
+          SELECT 1
+          FROM registros s
+          WHERE s.empleado_id = r.empleado_id
+            AND s.fecha_registro = :fecha
+            AND s.tipo_registro = 'SALIDA'
+      )
+    GROUP BY e.id, e.codigo_empleado, e.nombre_completo, r.punto_trabajo
+    ORDER BY hora_entrada
+""")
+
 
 async def consultar_registros_fecha(
     db,
     fecha: str,
     empleado_id: Optional[str] = None,
     restaurante: Optional[str] = None,
-    tipo: Optional[str] = None
+    tipo: Optional[str] = None,
+    por_pagina: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> dict:
     """
     Consulta registros de una fecha específica.
@@ -20,70 +176,62 @@ async def consultar_registros_fecha(
         empleado_id: UUID del empleado (opcional)
         restaurante: Filtrar por restaurante (opcional)
         tipo: ENTRADA o SALIDA (opcional)
+        por_pagina: Máximo de registros a devolver (opcional, default: todos)
+        cursor: siguiente_cursor de la página anterior (opcional)
 
     Returns:
         Lista de registros con datos del empleado
     """
-    query = """
-        SELECT
-            r.id,
-            r.empleado_id,
-            e.codigo_empleado,
-            e.nombre || ' ' || e.apellido AS empleado_nombre,
-            e.cargo,
-            e.departamento,
-            r.tipo_registro,
-            r.punto_trabajo,
-            r.fecha_registro,
-            r.hora_registro,
-            r.timestamp_registro,
-            r.confianza_reconocimiento,
-            r.observaciones
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE r.fecha_registro = :fecha
-          AND (:empleado_id::uuid IS NULL OR r.empleado_id = :empleado_id::uuid)
-          AND (:restaurante::text IS NULL OR r.punto_trabajo = :restaurante)
-          AND (:tipo::text IS NULL OR r.tipo_registro = :tipo)
-        ORDER BY r.hora_registro
-    """
+    # Mismo mínimo que el inputSchema de HTTP, para que stdio se comporte igual
+    if por_pagina is not None and por_pagina < 1:
+        return {'error': 'por_pagina debe ser mayor o igual a 1'}
     
     params = {
-        'fecha': fecha,
+        'fecha': date.fromisoformat(fecha),
         'empleado_id': empleado_id,
         'restaurante': restaurante,
         'tipo': tipo
     }
     
-    results = await db.execute(query, params)
+    # Los filtros ausentes no aparecen en el WHERE: el planner ve una
+    # consulta ajustada y puede usar el índice del filtro que sí viene
+    condiciones = _condiciones("r.fecha_registro = :fecha", params)
     
-    registros = []
-    for row in results:
-        registros.append({
-            'id': str(row['id']),
-            'empleado_id': str(row['empleado_id']),
-            'codigo_empleado': row['codigo_empleado'],
-            'empleado_nombre': row['empleado_nombre'],
-            'cargo': row['cargo'],
-            'departamento': row['departamento'],
-            'tipo_registro': row['tipo_registro'],
-            'punto_trabajo': row['punto_trabajo'],
-            'fecha_registro': str(row['fecha_registro']),
-            'hora_registro': str(row['hora_registro']),
-            'confianza': float(row['confianza_reconocimiento']) if row['confianza_reconocimiento'] else None,
-            'observaciones': row['observaciones']
-        })
+    # Paginación por clave (hora, id): cada página arranca después de la
+    # última fila de la anterior, sin OFFSET
+    if cursor:
+        c_hora, c_id = _decodificar_cursor(cursor)
+        params['c_hora'] = time.fromisoformat(c_hora)
+        params['c_id'] = c_id
+        condiciones += ("(r.hora_registro, r.id) > (:c_hora, CAST(:c_id AS uuid))",)
+    if por_pagina:
+        params['limite'] = por_pagina + 1
     
-    return {
+    query = _consulta_registros(
+        _SELECT_REGISTROS_FECHA,
+        condiciones,
+        "r.hora_registro, r.id",
+        bool(por_pagina)
+    )
+    
+    registros = await db.execute(query, params)
+    total, ultima = _cortar_pagina(registros, len(registros), por_pagina)
+    
+    resultado = {
         'fecha': fecha,
         'filtros': {
             'empleado_id': empleado_id,
             'restaurante': restaurante,
             'tipo': tipo
         },
-        'total_registros': len(registros),
+        'total_registros': total,
         'registros': registros
     }
+    if por_pagina:
+        resultado['siguiente_cursor'] = (
+            _codificar_cursor(ultima['hora_registro'], ultima['id']) if ultima else None
+        )
+    return resultado
 
 
 async def consultar_registros_rango(
@@ -91,7 +239,10 @@ async def consultar_registros_rango(
     fecha_inicio: str,
     fecha_fin: str,
     empleado_id: Optional[str] = None,
-    restaurante: Optional[str] = None
+    restaurante: Optional[str] = None,
+    columnas: bool = False,
+    por_pagina: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> dict:
     """
     Consulta registros en un rango de fechas.
@@ -102,53 +253,61 @@ async def consultar_registros_rango(
         fecha_fin: Fecha fin YYYY-MM-DD
         empleado_id: UUID del empleado (opcional)
         restaurante: Filtrar por restaurante (opcional)
+        columnas: Devolver los registros por columnas, una lista por campo
+            (default: False, una lista de filas)
+        por_pagina: Máximo de registros a devolver (opcional, default: todos)
+        cursor: siguiente_cursor de la página anterior (opcional)
 
     Returns:
         Lista de registros ordenados por fecha y hora
     """
-    query = """
-        SELECT
-            r.id,
-            r.empleado_id,
-            e.codigo_empleado,
-            e.nombre || ' ' || e.apellido AS empleado_nombre,
-            r.tipo_registro,
-            r.punto_trabajo,
-            r.fecha_registro,
-            r.hora_registro,
-            r.observaciones
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE r.fecha_registro BETWEEN :fecha_inicio AND :fecha_fin
-          AND (:empleado_id::uuid IS NULL OR r.empleado_id = :empleado_id::uuid)
-          AND (:restaurante::text IS NULL OR r.punto_trabajo = :restaurante)
-        ORDER BY r.fecha_registro, r.hora_registro
-    """
+    # Mismo mínimo que el inputSchema de HTTP, para que stdio se comporte igual
+    if por_pagina is not None and por_pagina < 1:
+        return {'error': 'por_pagina debe ser mayor o igual a 1'}
     
     params = {
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
+        'fecha_inicio': date.fromisoformat(fecha_inicio),
+        'fecha_fin': date.fromisoformat(fecha_fin),
         'empleado_id': empleado_id,
         'restaurante': restaurante
     }
     
-    results = await db.execute(query, params)
+    # Rango de un solo día: igualdad, mismo plan que consultar_registros_fecha
+    if fecha_inicio == fecha_fin:
+        filtro_fecha = "r.fecha_registro = :fecha_inicio"
+    else:
+        filtro_fecha = "r.fecha_registro BETWEEN :fecha_inicio AND :fecha_fin"
+    condiciones = _condiciones(filtro_fecha, params)
     
-    registros = []
-    for row in results:
-        registros.append({
-            'id': str(row['id']),
-            'empleado_id': str(row['empleado_id']),
-            'codigo_empleado': row['codigo_empleado'],
-            'empleado_nombre': row['empleado_nombre'],
-            'tipo_registro': row['tipo_registro'],
-            'punto_trabajo': row['punto_trabajo'],
-            'fecha_registro': str(row['fecha_registro']),
-            'hora_registro': str(row['hora_registro']),
-            'observaciones': row['observaciones']
-        })
+    # Paginación por clave (fecha, hora, id), igual que en una sola fecha
+    if cursor:
+        c_fecha, c_hora, c_id = _decodificar_cursor(cursor)
+        params['c_fecha'] = date.fromisoformat(c_fecha)
+        params['c_hora'] = time.fromisoformat(c_hora)
+        params['c_id'] = c_id
+        condiciones += (
+            "(r.fecha_registro, r.hora_registro, r.id) > (:c_fecha, :c_hora, CAST(:c_id AS uuid))",
+        )
+    if por_pagina:
+        params['limite'] = por_pagina + 1
     
-    return {
+    query = _consulta_registros(
+        _SELECT_REGISTROS_RANGO,
+        condiciones,
+        "r.fecha_registro, r.hora_registro, r.id",
+        bool(por_pagina)
+    )
+    
+    filas = await db.execute(query, params)
+    total = len(filas)
+    if columnas:
+        # Las claves salen de la lista de columnas: sin filas quedan listas vacías
+        registros = {campo: [row[campo] for row in filas] for campo in _COLUMNAS_RANGO}
+    else:
+        registros = filas
+    total, ultima = _cortar_pagina(registros, total, por_pagina)
+    
+    resultado = {
         'periodo': {
             'inicio': fecha_inicio,
             'fin': fecha_fin
@@ -157,38 +316,19 @@ async def consultar_registros_rango(
             'empleado_id': empleado_id,
             'restaurante': restaurante
         },
-        'total_registros': len(registros),
+        'total_registros': total,
         'registros': registros
     }
+    if por_pagina:
+        resultado['siguiente_cursor'] = (
+            _codificar_cursor(ultima['fecha_registro'], ultima['hora_registro'], ultima['id'])
+            if ultima else None
+        )
+    return resultado
 
 
-async def obtener_ultimo_registro(db, empleado_id: str) -> dict:
-    """
-    Obtiene el último registro de un empleado.
-
-    Args:
-        db: Instancia de Database
-        empleado_id: UUID del empleado
-
-    Returns:
-        Último registro y siguiente acción esperada
-    """
-    query = """
-        SELECT
-            r.tipo_registro,
-            r.fecha_registro,
-            r.hora_registro,
-            r.punto_trabajo,
-            e.nombre || ' ' || e.apellido AS empleado_nombre
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE r.empleado_id = :empleado_id::uuid
-        ORDER BY r.fecha_registro DESC, r.hora_registro DESC
-        LIMIT 1
-    """
-    
-    result = await db.execute_one(query, {'empleado_id': empleado_id})
-    
+def _ultimo_registro(empleado_id: str, result: Optional[dict]) -> dict:
+    """Arma la respuesta de último registro a partir de la fila (o None)"""
     if result:
         siguiente_accion = 'SALIDA' if result['tipo_registro'] == 'ENTRADA' else 'ENTRADA'
         return {
@@ -196,8 +336,8 @@ async def obtener_ultimo_registro(db, empleado_id: str) -> dict:
             'empleado_nombre': result['empleado_nombre'],
             'ultimo_registro': {
                 'tipo': result['tipo_registro'],
-                'fecha': str(result['fecha_registro']),
-                'hora': str(result['hora_registro']),
+                'fecha': result['fecha_registro'],
+                'hora': result['hora_registro'],
                 'punto_trabajo': result['punto_trabajo']
             },
             'siguiente_accion': siguiente_accion
@@ -212,6 +352,58 @@ async def obtener_ultimo_registro(db, empleado_id: str) -> dict:
         }
 
 
+async def obtener_ultimo_registro(db, empleado_id: str) -> dict:
+    """
+    Obtiene el último registro de un empleado.
+
+    Args:
+        db: Instancia de Database
+        empleado_id: UUID del empleado
+
+    Returns:
+        Último registro y siguiente acción esperada
+    """
+    result = await db.execute_one(_Q_ULTIMO_REGISTRO, {'empleado_id': empleado_id})
+    return _ultimo_registro(empleado_id, result)
+
+
+async def obtener_ultimos_registros(db, empleado_ids: list[str]) -> dict:
+    """
+    Obtiene el último registro de varios empleados en una sola consulta.
+
+    Args:
+        db: Instancia de Database
+        empleado_ids: UUIDs de los empleados
+
+    Returns:
+        Último registro y siguiente acción de cada empleado, en el orden pedido
+        y con el id tal como llegó; o un error con la lista de ids inválidos
+    """
+    # Forma canónica (la misma que devuelve el codec de uuid) de cada id tal
+    # como llegó: Postgres acepta también UUIDs sin guiones, con llaves, con
+    # espacios o en mayúsculas. La respuesta conserva el id original.
+    canonicos = {}
+    invalidos = []
+    for emp_id in dict.fromkeys(empleado_ids):
+        try:
+            canonicos[emp_id] = str(uuid.UUID(emp_id.strip()))
+        except ValueError:
+            invalidos.append(emp_id)
+    if invalidos:
+        return {'error': f'IDs de empleado inválidos: {", ".join(invalidos)}'}
+
+    results = await db.execute(_Q_ULTIMOS_REGISTROS, {'empleado_ids': list(set(canonicos.values()))})
+    por_empleado = {row['empleado_id']: row for row in results}
+
+    return {
+        'total': len(canonicos),
+        'empleados': [
+            _ultimo_registro(emp_id, por_empleado.get(canonico))
+            for emp_id, canonico in canonicos.items()
+        ]
+    }
+
+
 async def empleados_sin_salida(db, fecha: Optional[str] = None) -> dict:
     """
     Lista empleados con entrada pero sin salida registrada.
@@ -224,48 +416,20 @@ async def empleados_sin_salida(db, fecha: Optional[str] = None) -> dict:
         Lista de empleados pendientes
     """
     if fecha is None:
-        fecha = str(get_current_date())
-    
-    query = """
-        WITH entradas AS (
-            SELECT
-                empleado_id,
-                MIN(hora_registro) AS primera_entrada,
-                punto_trabajo
-            FROM registros
-            WHERE fecha_registro = :fecha
-              AND tipo_registro = 'ENTRADA'
-            GROUP BY empleado_id, punto_trabajo
-        ),
-        salidas AS (
-            SELECT DISTINCT empleado_id
-            FROM registros
-            WHERE fecha_registro = :fecha
-              AND tipo_registro = 'SALIDA'
-        )
-        SELECT
-            e.id AS empleado_id,
-            e.codigo_empleado,
-            e.nombre || ' ' || e.apellido AS empleado_nombre,
-            en.primera_entrada AS hora_entrada,
-            en.punto_trabajo,
-            EXTRACT(EPOCH FROM (NOW() - ((:fecha)::date + en.primera_entrada))) / 3600 AS horas_transcurridas
-        FROM entradas en
-        JOIN empleados e ON en.empleado_id = e.id
-        LEFT JOIN salidas s ON en.empleado_id = s.empleado_id
-        WHERE s.empleado_id IS NULL
-        ORDER BY en.primera_entrada
-    """
+        fecha_obj = get_current_date()
+        fecha = str(fecha_obj)
+    else:
+        fecha_obj = date.fromisoformat(fecha)
     
-    results = await db.execute(query, {'fecha': fecha})
+    results = await db.execute(_Q_SIN_SALIDA, {'fecha': fecha_obj})
     
     empleados = []
     for row in results:
         empleados.append({
-            'empleado_id': str(row['empleado_id']),
+            'empleado_id': row['empleado_id'],
             'codigo_empleado': row['codigo_empleado'],
             'empleado_nombre': row['empleado_nombre'],
-            'hora_entrada': str(row['hora_entrada']),
+            'hora_entrada': row['hora_entrada'],
             'punto_trabajo': row['punto_trabajo'],
             'horas_transcurridas': round(float(row['horas_transcurridas']), 2) if row['horas_transcurridas'] else 0
         })
@@ -1,9 +1,143 @@
 """Herramientas MCP para reportes de horas y estadísticas"""
 
+import os
+from itertools import groupby
+from operator import itemgetter
 from typing import Optional
-from datetime import date, datetime
-from ..utils.fechas import get_current_date, get_week_range, get_month_range, format_date
-from ..utils.calculos import calcular_horas_dia, calcular_valor_horas, LIMITE_SEMANAL
+from datetime import date
+from sqlalchemy import text
+from ..utils.fechas import MESES, get_current_date, get_week_range, get_month_range, format_date
+from ..utils.calculos import (
+    calcular_horas_dia, calcular_horas_intervalos, calcular_valor_horas, LIMITE_SEMANAL
+)
+
+# Segundos que se reutiliza la tabla configuracion leída de la BD. Tras
+# modificarla, db.invalidar_cache(CONFIG_CACHE_CLAVE) la relee de inmediato
+CONFIG_TTL = int(os.getenv("CONFIG_CACHE_TTL", "300"))
+CONFIG_CACHE_CLAVE = "config:all"
+
+# Intervalos (entrada, salida) por empleado y día emparejados en SQL, con el
+# mismo criterio que emparejar_registros: grupo = SALIDAs previas del día, y en
+# cada grupo la primera ENTRADA se empareja con su SALIDA. Los grupos
+# incompletos quedan con NULL: el día cuenta como trabajado aunque no tenga
+# intervalos completos. La usan también los reportes de nómina.
+Q_INTERVALOS = text("""
+    WITH marcas AS (
+        SELECT
+            r.empleado_id,
+            r.fecha_registro,
+            r.tipo_registro,
+            r.hora_registro,
+            COUNT(*) FILTER (WHERE r.tipo_registro = 'SALIDA') OVER (
+                PARTITION BY r.fecha_registro, r.empleado_id
+                ORDER BY r.hora_registro
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) AS grupo
+        FROM registros r
+        WHERE r.fecha_registro BETWEEN :inicio AND :fin
+          AND (CAST(:empleado_id AS uuid) IS NULL OR r.empleado_id = CAST(:empleado_id AS uuid))
+          AND (CAST(:restaurante AS text) IS NULL OR r.punto_trabajo = :restaurante)
+    ),
+    intervalos AS (
+        SELECT
+            empleado_id,
+            fecha_registro,
+            MIN(hora_registro) FILTER (WHERE tipo_registro = 'ENTRADA') AS entrada,
+            MIN(hora_registro) FILTER (WHERE tipo_registro = 'SALIDA') AS salida
+        FROM marcas
+        GROUP BY empleado_id, fecha_registro, grupo
+    )
+    SELECT
+        i.empleado_id,
+        e.codigo_empleado,
+        e.nombre_completo AS empleado_nombre,
+        e.cargo,
+        e.departamento,
+        e.liquida_dominical,
+        i.fecha_registro,
+        i.entrada,
+        i.salida
+    FROM intervalos i
+    JOIN empleados e ON i.empleado_id = e.id
+    WHERE e.activo = TRUE
+    ORDER BY e.apellido, e.nombre, i.empleado_id, i.fecha_registro, i.entrada
+""")
+
+# Empleado y sus registros del día en una sola consulta: sin filas si el
+# empleado no existe, una fila con tipo_registro NULL si no tiene registros
+_Q_EMPLEADO_REGISTROS_DIA = text("""
+    SELECT
+        e.nombre_completo AS nombre,
+        e.liquida_dominical,
+        r.tipo_registro,
+        r.hora_registro,
+        r.observaciones
+    FROM empleados e
+    LEFT JOIN LATERAL (
+        SELECT tipo_registro, hora_registro, observaciones
+        FROM registros
+        WHERE empleado_id = e.id
+          AND fecha_registro = :fecha
+    ) r ON TRUE
+    WHERE e.id = CAST(:empleado_id AS uuid)
+    ORDER BY r.hora_registro
+""")
+
+# Una sola pasada: una fila por restaurante más la fila del total general
+# (conjunto vacío, GROUPING(punto_trabajo) = 1)
+_Q_ESTADISTICAS = text("""
+    SELECT
+        COUNT(*) AS total_registros,
+        COUNT(DISTINCT empleado_id) AS empleados_unicos,
+        COUNT(*) FILTER (WHERE tipo_registro = 'ENTRADA') AS entradas,
+        COUNT(*) FILTER (WHERE tipo_registro = 'SALIDA') AS salidas,
+        COUNT(*) FILTER (WHERE forzado) AS forzados,
+        punto_trabajo,
+        GROUPING(punto_trabajo) = 1 AS es_total
+    FROM registros
+    WHERE fecha_registro BETWEEN :fecha_inicio AND :fecha_fin
+      AND (CAST(:restaurante AS text) IS NULL OR punto_trabajo = :restaurante)
+    GROUP BY GROUPING SETS ((punto_trabajo), ())
+""")
+
+_Q_CONFIGURACION = text("""
+    SELECT clave, valor, descripcion, tipo_dato
+    FROM configuracion
+    ORDER BY clave
+""")
+
+
+def _pares_por_dia(filas):
+    """
+    Recorre los intervalos de un empleado (ordenados por fecha) día a día.
+
+    Yields:
+        (fecha, pares completos (entrada, salida) del día); un día solo con
+        intervalos incompletos se entrega con la lista vacía
+    """
+    for fecha, filas_dia in groupby(filas, key=itemgetter('fecha_registro')):
+        yield fecha, [
+            (f['entrada'], f['salida']) for f in filas_dia
+            if f['entrada'] is not None and f['salida'] is not None
+        ]
+
+
+def _dias_por_empleado(filas):
+    """
+    Agrupa por empleado los intervalos de Q_INTERVALOS y calcula sus días.
+
+    Las filas llegan ordenadas por empleado y fecha: se agrupan en una sola
+    pasada, sin armar un diccionario con todo el reporte.
+
+    Yields:
+        (primera fila del empleado, desglose de horas de cada día)
+    """
+    for _, filas_emp in groupby(filas, key=itemgetter('empleado_id')):
+        filas_emp = list(filas_emp)
+        yield filas_emp[0], [
+            calcular_horas_intervalos(pares, fecha)
+            for fecha, pares in _pares_por_dia(filas_emp)
+        ]
 
 
 async def calcular_horas_trabajadas_dia(db, empleado_id: str, fecha: str) -> dict:
@@ -18,33 +152,20 @@ async def calcular_horas_trabajadas_dia(db, empleado_id: str, fecha: str) -> dic
     Returns:
         Desglose de horas trabajadas
     """
-    # Obtener datos del empleado
-    empleado_query = """
-        SELECT nombre || ' ' || apellido AS nombre, liquida_dominical
-        FROM empleados WHERE id = :empleado_id::uuid
-    """
-    empleado = await db.execute_one(empleado_query, {'empleado_id': empleado_id})
+    fecha_obj = date.fromisoformat(fecha)
     
-    if not empleado:
-        return {'error': f'Empleado {empleado_id} no encontrado'}
-    
-    # Obtener registros del día
-    registros_query = """
-        SELECT
-            tipo_registro,
-            hora_registro,
-            observaciones
-        FROM registros
-        WHERE empleado_id = :empleado_id::uuid
-          AND fecha_registro = :fecha
-        ORDER BY hora_registro
-    """
-    
-    registros = await db.execute(registros_query, {
+    # Un solo round-trip y una sola conexión del pool
+    filas = await db.execute(_Q_EMPLEADO_REGISTROS_DIA, {
         'empleado_id': empleado_id,
-        'fecha': fecha
+        'fecha': fecha_obj
     })
     
+    if not filas:
+        return {'error': f'Empleado {empleado_id} no encontrado'}
+    
+    empleado = filas[0]
+    registros = [f for f in filas if f['tipo_registro'] is not None]
+    
     if not registros:
         return {
             'empleado_id': empleado_id,
@@ -55,7 +176,6 @@ async def calcular_horas_trabajadas_dia(db, empleado_id: str, fecha: str) -> dic
         }
     
     # Calcular horas
-    fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
     resultado = calcular_horas_dia(registros, fecha_obj)
     
     # Agregar info del empleado
@@ -65,7 +185,7 @@ async def calcular_horas_trabajadas_dia(db, empleado_id: str, fecha: str) -> dic
     
     # Agregar registros crudos para referencia
     resultado['registros'] = [
-        {'tipo': r['tipo_registro'], 'hora': str(r['hora_registro']), 'obs': r['observaciones']}
+        {'tipo': r['tipo_registro'], 'hora': r['hora_registro'], 'obs': r['observaciones']}
         for r in registros
     ]
     
@@ -92,67 +212,22 @@ async def reporte_horas_semanal(
     """
     # Determinar rango de la semana
     if fecha_semana:
-        fecha_ref = datetime.strptime(fecha_semana, '%Y-%m-%d').date()
+        fecha_ref = date.fromisoformat(fecha_semana)
     else:
         fecha_ref = get_current_date()
     
     inicio_semana, fin_semana = get_week_range(fecha_ref)
     
-    # Obtener registros de la semana
-    query = """
-        SELECT
-            r.empleado_id,
-            e.codigo_empleado,
-            e.nombre || ' ' || e.apellido AS empleado_nombre,
-            e.liquida_dominical,
-            e.dia_descanso,
-            r.fecha_registro,
-            r.tipo_registro,
-            r.hora_registro,
-            r.observaciones,
-            EXTRACT(DOW FROM r.fecha_registro) AS dia_semana
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE r.fecha_registro BETWEEN :inicio AND :fin
-          AND (:empleado_id IS NULL OR r.empleado_id = :empleado_id::uuid)
-          AND (:restaurante IS NULL OR r.punto_trabajo = :restaurante)
-          AND e.activo = TRUE
-        ORDER BY e.apellido, e.nombre, r.fecha_registro, r.hora_registro
-    """
-    
-    results = await db.execute(query, {
-        'inicio': str(inicio_semana),
-        'fin': str(fin_semana),
+    # Intervalos de la semana ya emparejados en la BD (ver Q_INTERVALOS)
+    results = await db.execute(Q_INTERVALOS, {
+        'inicio': inicio_semana,
+        'fin': fin_semana,
         'empleado_id': empleado_id,
         'restaurante': restaurante
     })
     
-    # Agrupar por empleado
-    empleados_data = {}
-    for row in results:
-        emp_id = str(row['empleado_id'])
-        if emp_id not in empleados_data:
-            empleados_data[emp_id] = {
-                'empleado_id': emp_id,
-                'codigo': row['codigo_empleado'],
-                'nombre': row['empleado_nombre'],
-                'liquida_dominical': row['liquida_dominical'],
-                'registros_por_fecha': {}
-            }
-        
-        fecha = str(row['fecha_registro'])
-        if fecha not in empleados_data[emp_id]['registros_por_fecha']:
-            empleados_data[emp_id]['registros_por_fecha'][fecha] = []
-        
-        empleados_data[emp_id]['registros_por_fecha'][fecha].append({
-            'tipo_registro': row['tipo_registro'],
-            'hora_registro': row['hora_registro']
-        })
-    
-    # Calcular horas por empleado
     reportes = []
-    for emp_id, data in empleados_data.items():
-        dias = []
+    for empleado, dias in _dias_por_empleado(results):
         totales = {
             'horas_trabajadas': 0,
             'horas_ordinarias': 0,
@@ -162,12 +237,7 @@ async def reporte_horas_semanal(
             'horas_dominical': 0
         }
         
-        for fecha_str, registros in data['registros_por_fecha'].items():
-            fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-            horas_dia = calcular_horas_dia(registros, fecha_obj)
-            horas_dia['fecha'] = fecha_str
-            dias.append(horas_dia)
-            
+        for horas_dia in dias:
             for key in totales:
                 totales[key] += horas_dia.get(key, 0)
         
@@ -180,9 +250,9 @@ async def reporte_horas_semanal(
         horas_exceso = max(0, totales['horas_trabajadas'] - LIMITE_SEMANAL)
         
         reportes.append({
-            'empleado_id': emp_id,
-            'codigo': data['codigo'],
-            'nombre': data['nombre'],
+            'empleado_id': empleado['empleado_id'],
+            'codigo': empleado['codigo_empleado'],
+            'nombre': empleado['empleado_nombre'],
             'semana_inicio': str(inicio_semana),
             'semana_fin': str(fin_semana),
             'dias': dias,
@@ -227,71 +297,22 @@ async def reporte_horas_mensual(
     """
     inicio_mes, fin_mes = get_month_range(anio, mes)
     
-    meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-             "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-    periodo = f"{meses[mes]} {anio}"
-    
-    query = """
-        SELECT
-            r.empleado_id,
-            e.codigo_empleado,
-            e.nombre,
-            e.apellido,
-            e.cargo,
-            e.departamento,
-            e.liquida_dominical,
-            r.fecha_registro,
-            r.tipo_registro,
-            r.hora_registro,
-            r.observaciones,
-            EXTRACT(DOW FROM r.fecha_registro) AS dia_semana,
-            EXTRACT(WEEK FROM r.fecha_registro) AS semana_num
-        FROM registros r
-        JOIN empleados e ON r.empleado_id = e.id
-        WHERE EXTRACT(YEAR FROM r.fecha_registro) = :anio
-          AND EXTRACT(MONTH FROM r.fecha_registro) = :mes
-          AND (:empleado_id IS NULL OR r.empleado_id = :empleado_id::uuid)
-          AND (:restaurante IS NULL OR r.punto_trabajo = :restaurante)
-          AND e.activo = TRUE
-        ORDER BY e.apellido, e.nombre, r.fecha_registro, r.hora_registro
-    """
+    periodo = f"{MESES[mes]} {anio}"
     
-    results = await db.execute(query, {
-        'anio': anio,
-        'mes': mes,
+    # La BD empareja entradas y salidas: llega una fila por intervalo en vez
+    # de una por marcación, y en Python solo se clasifican las horas. El mes
+    # se filtra como rango de fechas (no EXTRACT) para usar los índices.
+    results = await db.execute(Q_INTERVALOS, {
+        'inicio': inicio_mes,
+        'fin': fin_mes,
         'empleado_id': empleado_id,
         'restaurante': restaurante
     })
     
-    # Agrupar por empleado
-    empleados_data = {}
-    for row in results:
-        emp_id = str(row['empleado_id'])
-        if emp_id not in empleados_data:
-            empleados_data[emp_id] = {
-                'empleado_id': emp_id,
-                'codigo': row['codigo_empleado'],
-                'nombre': f"{row['nombre']} {row['apellido']}",
-                'cargo': row['cargo'],
-                'departamento': row['departamento'],
-                'liquida_dominical': row['liquida_dominical'],
-                'registros_por_fecha': {}
-            }
-        
-        fecha = str(row['fecha_registro'])
-        if fecha not in empleados_data[emp_id]['registros_por_fecha']:
-            empleados_data[emp_id]['registros_por_fecha'][fecha] = []
-        
-        empleados_data[emp_id]['registros_por_fecha'][fecha].append({
-            'tipo_registro': row['tipo_registro'],
-            'hora_registro': row['hora_registro']
-        })
-    
-    # Calcular por empleado
     reportes = []
-    for emp_id, data in empleados_data.items():
+    for empleado, dias in _dias_por_empleado(results):
         resumen = {
-            'dias_trabajados': len(data['registros_por_fecha']),
+            'dias_trabajados': len(dias),
             'total_horas': 0,
             'horas_ordinarias': 0,
             'horas_extra_diurna': 0,
@@ -300,10 +321,7 @@ async def reporte_horas_mensual(
             'horas_dominical': 0
         }
         
-        for fecha_str, registros in data['registros_por_fecha'].items():
-            fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-            horas_dia = calcular_horas_dia(registros, fecha_obj)
-            
+        for horas_dia in dias:
             resumen['total_horas'] += horas_dia['horas_trabajadas']
             resumen['horas_ordinarias'] += horas_dia['horas_ordinarias']
             resumen['horas_extra_diurna'] += horas_dia['horas_extra_diurna']
@@ -317,11 +335,11 @@ async def reporte_horas_mensual(
                 resumen[key] = round(resumen[key], 2)
         
         reportes.append({
-            'empleado_id': emp_id,
-            'codigo': data['codigo'],
-            'nombre': data['nombre'],
-            'cargo': data['cargo'],
-            'departamento': data['departamento'],
+            'empleado_id': empleado['empleado_id'],
+            'codigo': empleado['codigo_empleado'],
+            'nombre': empleado['empleado_nombre'],
+            'cargo': empleado['cargo'],
+            'departamento': empleado['departamento'],
             'periodo': periodo,
             'resumen': resumen
         })
@@ -359,23 +377,9 @@ async def estadisticas_asistencia(
     Returns:
         Estadísticas del período
     """
-    query = """
-        SELECT
-            COUNT(*) AS total_registros,
-            COUNT(DISTINCT empleado_id) AS empleados_unicos,
-            COUNT(*) FILTER (WHERE tipo_registro = 'ENTRADA') AS entradas,
-            COUNT(*) FILTER (WHERE tipo_registro = 'SALIDA') AS salidas,
-            COUNT(*) FILTER (WHERE observaciones LIKE '%FORZADO%') AS forzados,
-            punto_trabajo
-        FROM registros
-        WHERE fecha_registro BETWEEN :fecha_inicio AND :fecha_fin
-          AND (:restaurante IS NULL OR punto_trabajo = :restaurante)
-        GROUP BY punto_trabajo
-    """
-    
-    results = await db.execute(query, {
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
+    results = await db.execute(_Q_ESTADISTICAS, {
+        'fecha_inicio': date.fromisoformat(fecha_inicio),
+        'fecha_fin': date.fromisoformat(fecha_fin),
         'restaurante': restaurante
     })
     
@@ -389,10 +393,13 @@ async def estadisticas_asistencia(
     
     por_restaurante = []
     for row in results:
-        totales['total_registros'] += row['total_registros']
-        totales['entradas'] += row['entradas']
-        totales['salidas'] += row['salidas']
-        totales['registros_forzados'] += row['forzados']
+        if row['es_total']:
+            totales['total_registros'] = row['total_registros']
+            totales['empleados_unicos'] = row['empleados_unicos']
+            totales['entradas'] = row['entradas']
+            totales['salidas'] = row['salidas']
+            totales['registros_forzados'] = row['forzados']
+            continue
         
         por_restaurante.append({
             'restaurante': row['punto_trabajo'],
@@ -400,20 +407,6 @@ async def estadisticas_asistencia(
             'empleados': row['empleados_unicos']
         })
     
-    # Obtener empleados únicos totales
-    query_empleados = """
-        SELECT COUNT(DISTINCT empleado_id) AS total
-        FROM registros
-        WHERE fecha_registro BETWEEN :fecha_inicio AND :fecha_fin
-          AND (:restaurante IS NULL OR punto_trabajo = :restaurante)
-    """
-    emp_result = await db.execute_one(query_empleados, {
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        'restaurante': restaurante
-    })
-    totales['empleados_unicos'] = emp_result['total'] if emp_result else 0
-    
     return {
         'periodo': {
             'inicio': fecha_inicio,
@@ -424,6 +417,11 @@ async def estadisticas_asistencia(
     }
 
 
+async def leer_configuracion(db) -> list[dict]:
+    """Tabla configuracion completa, desde el caché en memoria de db"""
+    return await db.cached(CONFIG_CACHE_CLAVE, CONFIG_TTL, lambda: db.execute(_Q_CONFIGURACION, {}))
+
+
 async def obtener_configuracion(db, clave: Optional[str] = None) -> dict:
     """
     Obtiene configuraciones del sistema.
@@ -435,14 +433,10 @@ async def obtener_configuracion(db, clave: Optional[str] = None) -> dict:
     Returns:
         Configuración o lista de configuraciones
     """
-    query = """
-        SELECT clave, valor, descripcion, tipo_dato
-        FROM configuracion
-        WHERE (:clave::text IS NULL OR clave = :clave)
-        ORDER BY clave
-    """
-    
-    results = await db.execute(query, {'clave': clave})
+    # La tabla es pequeña y casi no cambia: se cachea completa y se filtra aquí
+    results = await leer_configuracion(db)
+    if clave:
+        results = [row for row in results if row['clave'] == clave]
     
     if clave and results:
         row = results[0]
@@ -1,11 +1,14 @@
 """Utilidades de cálculo de horas laborales según normativa colombiana"""
 
-from datetime import datetime, time, date, timedelta
+from datetime import time, date
+from functools import lru_cache
 from typing import List, Dict
 
 # Constantes laborales Colombia
 HORA_INICIO_NOCTURNO = time(21, 0)  # 9:00 PM
 HORA_FIN_NOCTURNO = time(6, 0)      # 6:00 AM
+MINUTO_INICIO_NOCTURNO = 21 * 60    # 1260, minutos desde medianoche
+MINUTO_FIN_NOCTURNO = 6 * 60        # 360
 JORNADA_ORDINARIA = 8               # horas
 LIMITE_SEMANAL = 48                 # horas
 
@@ -18,46 +21,82 @@ FACTOR_EXTRA_DOMINICAL_DIURNA = 2.0    # +100%
 FACTOR_EXTRA_DOMINICAL_NOCTURNA = 2.5  # +150%
 
 
+US_POR_MINUTO = 60 * 1_000_000
+US_POR_DIA = 24 * 60 * US_POR_MINUTO
+
+
+def _microsegundo_del_dia(hora: time) -> int:
+    """Microsegundos desde medianoche; // US_POR_MINUTO da el minuto del día"""
+    return ((hora.hour * 60 + hora.minute) * 60 + hora.second) * 1_000_000 + hora.microsecond
+
+
 def es_hora_nocturna(hora: time) -> bool:
     """Determina si una hora está en franja nocturna (21:00 - 06:00)"""
-    return hora >= HORA_INICIO_NOCTURNO or hora < HORA_FIN_NOCTURNO
+    minuto = hora.hour * 60 + hora.minute
+    return minuto >= MINUTO_INICIO_NOCTURNO or minuto < MINUTO_FIN_NOCTURNO
 
 
 def calcular_diferencia_horas(inicio: time, fin: time) -> float:
     """Calcula diferencia en horas entre dos tiempos"""
-    inicio_dt = datetime.combine(date.today(), inicio)
-    fin_dt = datetime.combine(date.today(), fin)
+    return _diferencia_horas(_microsegundo_del_dia(inicio), _microsegundo_del_dia(fin))
+
 
+def _diferencia_horas(inicio_us: int, fin_us: int) -> float:
+    # Aritmética entera sobre microsegundos, sin crear datetimes.
     # Si fin es menor que inicio, asumimos que cruzó medianoche
-    if fin < inicio:
-        fin_dt += timedelta(days=1)
+    if fin_us < inicio_us:
+        fin_us += US_POR_DIA
 
-    diferencia = (fin_dt - inicio_dt).total_seconds() / 3600
+    diferencia = (fin_us - inicio_us) / 1_000_000 / 3600
     return round(diferencia, 2)
 
 
+def _solape(inicio: int, fin: int, desde: int, hasta: int) -> int:
+    """Minutos en común entre [inicio, fin) y [desde, hasta)"""
+    return max(0, min(fin, hasta) - max(inicio, desde))
+
+
 def calcular_horas_nocturnas(entrada: time, salida: time) -> float:
     """Calcula cuántas horas de un intervalo son nocturnas"""
-    total_nocturnas = 0.0
-
     # Convertir a minutos desde medianoche para facilitar cálculos
-    entrada_min = entrada.hour * 60 + entrada.minute
-    salida_min = salida.hour * 60 + salida.minute
+    return _horas_nocturnas(entrada.hour * 60 + entrada.minute, salida.hour * 60 + salida.minute)
+
 
+def _horas_nocturnas(entrada_min: int, salida_min: int) -> float:
     # Si cruzó medianoche
     if salida_min < entrada_min:
         salida_min += 24 * 60
 
-    # Franja nocturna: 21:00 (1260 min) a 06:00 (360 min)
-    nocturno_inicio = 21 * 60  # 1260
-    nocturno_fin = 6 * 60      # 360
-
-    for minuto in range(entrada_min, salida_min):
-        minuto_normalizado = minuto % (24 * 60)
-        if minuto_normalizado >= nocturno_inicio or minuto_normalizado < nocturno_fin:
-            total_nocturnas += 1/60
-
-    return round(total_nocturnas, 2)
+    # Franja nocturna: 21:00 (1260 min) a 06:00 (360 min). El intervalo
+    # abarca a lo sumo dos días, así que basta intersecarlo con las franjas
+    # nocturnas de ambos: se suman minutos enteros y se divide una sola vez
+    nocturno_inicio = MINUTO_INICIO_NOCTURNO
+    nocturno_fin = MINUTO_FIN_NOCTURNO
+    dia = 24 * 60
+
+    total_minutos = (
+        _solape(entrada_min, salida_min, 0, nocturno_fin)
+        + _solape(entrada_min, salida_min, nocturno_inicio, dia + nocturno_fin)
+        + _solape(entrada_min, salida_min, dia + nocturno_inicio, 2 * dia)
+    )
+
+    return round(total_minutos / 60, 2)
+
+
+def emparejar_registros(registros: List[Dict]) -> List[tuple]:
+    """Empareja cada ENTRADA con la siguiente SALIDA; retorna [(entrada, salida)]"""
+    # Una sola pasada: la primera ENTRADA pendiente se cierra con la siguiente
+    # SALIDA; las ENTRADAs repetidas y las SALIDAs sin entrada se ignoran
+    pares = []
+    entrada = None
+    for registro in registros:
+        if registro['tipo_registro'] == 'ENTRADA':
+            if entrada is None:
+                entrada = registro['hora_registro']
+        elif registro['tipo_registro'] == 'SALIDA' and entrada is not None:
+            pares.append((entrada, registro['hora_registro']))
+            entrada = None
+    return pares
 
 
 def calcular_horas_dia(registros: List[Dict], fecha: date) -> Dict:
@@ -71,6 +110,37 @@ def calcular_horas_dia(registros: List[Dict], fecha: date) -> Dict:
     Returns:
         Diccionario con desglose de horas
     """
+    return calcular_horas_intervalos(emparejar_registros(registros), fecha)
+
+
+def calcular_horas_intervalos(pares: List[tuple], fecha: date) -> Dict:
+    """
+    Calcula el desglose de horas de un día a partir de intervalos ya emparejados.
+
+    Args:
+        pares: Lista de (entrada, salida) ordenada por hora de entrada
+        fecha: Fecha del cálculo
+
+    Returns:
+        Diccionario con desglose de horas (igual que calcular_horas_dia)
+    """
+    # El caché guarda solo tuplas: cada llamada arma dicts y listas nuevos,
+    # así un llamador que los modifique no altera el resultado de los demás
+    resumen, intervalos = _horas_intervalos(tuple(pares), fecha)
+    horas = dict(resumen)
+    horas['intervalos'] = [dict(zip(_CAMPOS_INTERVALO, intervalo)) for intervalo in intervalos]
+    horas['total_intervalos'] = len(intervalos)
+    return horas
+
+
+_CAMPOS_INTERVALO = ('entrada', 'salida', 'horas', 'horas_nocturnas', 'horas_diurnas')
+
+
+# El desglose depende solo de las marcaciones y la fecha, que forman la
+# clave: un día ya calculado (semanas solapadas, reintentos, el mismo día en
+# el reporte semanal y la nómina) no se recalcula y no hay que invalidar nada
+@lru_cache(maxsize=50000)
+def _horas_intervalos(pares: tuple, fecha: date) -> tuple:
     intervalos = []
     horas_total = 0.0
     horas_nocturnas_total = 0.0
@@ -78,62 +148,60 @@ def calcular_horas_dia(registros: List[Dict], fecha: date) -> Dict:
     # Determinar si es domingo (6 = domingo en weekday())
     es_domingo = fecha.weekday() == 6
 
-    # Emparejar ENTRADA con siguiente SALIDA
-    i = 0
-    while i < len(registros):
-        if registros[i]['tipo_registro'] == 'ENTRADA':
-            entrada = registros[i]['hora_registro']
-
-            # Buscar siguiente SALIDA
-            for j in range(i + 1, len(registros)):
-                if registros[j]['tipo_registro'] == 'SALIDA':
-                    salida = registros[j]['hora_registro']
-
-                    horas = calcular_diferencia_horas(entrada, salida)
-                    horas_nocturnas = calcular_horas_nocturnas(entrada, salida)
-
-                    intervalos.append({
-                        'entrada': str(entrada),
-                        'salida': str(salida),
-                        'horas': horas,
-                        'horas_nocturnas': horas_nocturnas,
-                        'horas_diurnas': round(horas - horas_nocturnas, 2)
-                    })
-
-                    horas_total += horas
-                    horas_nocturnas_total += horas_nocturnas
-                    i = j
-                    break
-        i += 1
-
-    # Calcular desglose
-    horas_diurnas_total = round(horas_total - horas_nocturnas_total, 2)
+    for entrada, salida in pares:
+        # Cada marcación se convierte a entero una sola vez; el minuto del
+        # día sale del mismo valor para las horas nocturnas
+        entrada_us = _microsegundo_del_dia(entrada)
+        salida_us = _microsegundo_del_dia(salida)
+        horas = _diferencia_horas(entrada_us, salida_us)
+        horas_nocturnas = _horas_nocturnas(entrada_us // US_POR_MINUTO, salida_us // US_POR_MINUTO)
+
+        # date/time se dejan tal cual: orjson los serializa en ISO al
+        # responder, igual que str(), y quien solo suma totales no paga el formateo
+        intervalos.append((entrada, salida, horas, horas_nocturnas, round(horas - horas_nocturnas, 2)))
+
+        horas_total += horas
+        horas_nocturnas_total += horas_nocturnas
 
     # Horas ordinarias vs extras
     horas_ordinarias = min(horas_total, JORNADA_ORDINARIA)
     horas_extra = max(0, horas_total - JORNADA_ORDINARIA)
 
-    # Distribuir extras entre diurnas y nocturnas
+    # Distribuir extras entre diurnas y nocturnas (con extras, horas_total > 0)
     if horas_extra > 0:
-        proporcion_nocturna = horas_nocturnas_total / horas_total if horas_total > 0 else 0
+        proporcion_nocturna = horas_nocturnas_total / horas_total
         horas_extra_nocturna = round(horas_extra * proporcion_nocturna, 2)
         horas_extra_diurna = round(horas_extra - horas_extra_nocturna, 2)
     else:
         horas_extra_diurna = 0
         horas_extra_nocturna = 0
 
-    return {
-        'fecha': str(fecha),
-        'es_domingo': es_domingo,
-        'horas_trabajadas': round(horas_total, 2),
-        'horas_ordinarias': round(horas_ordinarias, 2),
-        'horas_extra_diurna': horas_extra_diurna,
-        'horas_extra_nocturna': horas_extra_nocturna,
-        'horas_recargo_nocturno': round(horas_nocturnas_total, 2),
-        'horas_dominical': round(horas_total, 2) if es_domingo else 0,
-        'intervalos': intervalos,
-        'total_intervalos': len(intervalos)
-    }
+    horas_trabajadas = round(horas_total, 2)
+
+    resumen = (
+        ('fecha', fecha),
+        ('es_domingo', es_domingo),
+        ('horas_trabajadas', horas_trabajadas),
+        ('horas_ordinarias', round(horas_ordinarias, 2)),
+        ('horas_extra_diurna', horas_extra_diurna),
+        ('horas_extra_nocturna', horas_extra_nocturna),
+        ('horas_recargo_nocturno', round(horas_nocturnas_total, 2)),
+        ('horas_dominical', horas_trabajadas if es_domingo else 0)
+    )
+    return resumen, tuple(intervalos)
+
+
+# La configuración casi nunca cambia: las tarifas derivadas se calculan una
+# vez por combinación de valores y no en cada día de cada empleado
+@lru_cache(maxsize=64)
+def _tarifas(valor_ordinaria, valor_extra_diurna, valor_extra_nocturna) -> tuple:
+    """Valores hora (ordinaria, extra diurna, extra nocturna) ya convertidos a float"""
+    valor_ordinaria = float(valor_ordinaria)
+    return (
+        valor_ordinaria,
+        float(valor_extra_diurna) if valor_extra_diurna is not None else valor_ordinaria * FACTOR_EXTRA_DIURNA,
+        float(valor_extra_nocturna) if valor_extra_nocturna is not None else valor_ordinaria * FACTOR_EXTRA_NOCTURNA
+    )
 
 
 def calcular_valor_horas(horas: Dict, config: Dict) -> Dict:
@@ -147,22 +215,30 @@ def calcular_valor_horas(horas: Dict, config: Dict) -> Dict:
     Returns:
         Diccionario con valores calculados
     """
-    valor_ordinaria = float(config.get('valor_hora_ordinaria', 5833.33))
-    valor_extra_diurna = float(config.get('valor_hora_extra_diurna', valor_ordinaria * FACTOR_EXTRA_DIURNA))
-    valor_extra_nocturna = float(config.get('valor_hora_extra_nocturna', valor_ordinaria * FACTOR_EXTRA_NOCTURNA))
-
-    valores = {
-        'ordinarias': round(horas['horas_ordinarias'] * valor_ordinaria, 2),
-        'extra_diurna': round(horas['horas_extra_diurna'] * valor_extra_diurna, 2),
-        'extra_nocturna': round(horas['horas_extra_nocturna'] * valor_extra_nocturna, 2),
-        'recargo_nocturno': round(horas['horas_recargo_nocturno'] * valor_ordinaria * FACTOR_RECARGO_NOCTURNO, 2),
-    }
-
-    if horas.get('es_domingo'):
-        valores['dominical'] = round(horas['horas_dominical'] * valor_ordinaria * FACTOR_DOMINICAL, 2)
-    else:
-        valores['dominical'] = 0
-
-    valores['total'] = sum(valores.values())
+    valor_ordinaria, valor_extra_diurna, valor_extra_nocturna = _tarifas(
+        config.get('valor_hora_ordinaria', 5833.33),
+        config.get('valor_hora_extra_diurna'),
+        config.get('valor_hora_extra_nocturna')
+    )
+
+    horas_ordinarias = horas['horas_ordinarias']
+    horas_extra_diurna = horas['horas_extra_diurna']
+    horas_extra_nocturna = horas['horas_extra_nocturna']
+    horas_recargo_nocturno = horas['horas_recargo_nocturno']
+    horas_dominical = horas['horas_dominical']
+    es_domingo = horas.get('es_domingo')
+
+    ordinarias = round(horas_ordinarias * valor_ordinaria, 2)
+    extra_diurna = round(horas_extra_diurna * valor_extra_diurna, 2)
+    extra_nocturna = round(horas_extra_nocturna * valor_extra_nocturna, 2)
+    recargo_nocturno = round(horas_recargo_nocturno * valor_ordinaria * FACTOR_RECARGO_NOCTURNO, 2)
+    dominical = round(horas_dominical * valor_ordinaria * FACTOR_DOMINICAL, 2) if es_domingo else 0
 
-    return valores
+    return {
+        'ordinarias': ordinarias,
+        'extra_diurna': extra_diurna,
+        'extra_nocturna': extra_nocturna,
+        'recargo_nocturno': recargo_nocturno,
+        'dominical': dominical,
+        'total': ordinarias + extra_diurna + extra_nocturna + recargo_nocturno + dominical
+    }
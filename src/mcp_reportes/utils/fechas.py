@@ -1,14 +1,26 @@
 """Utilidades para manejo de fechas"""
 
 from datetime import date, datetime, timedelta
-import pytz
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 import os
 
+# Nombres de los meses indexados por número (1-12)
+MESES = (
+    "", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+)
 
+# " de <Mes> de " ya armado por mes para format_date
+_DE_MES = tuple(f" de {mes} de " for mes in MESES)
+
+
+# TIMEZONE se lee una sola vez, en el primer uso (después de cargar el .env)
+@lru_cache(maxsize=1)
 def get_timezone():
     """Obtiene la zona horaria configurada"""
     tz_name = os.getenv("TIMEZONE", "America/Bogota")
-    return pytz.timezone(tz_name)
+    return ZoneInfo(tz_name)
 
 
 def get_current_date() -> date:
@@ -43,6 +55,7 @@ def get_week_range(fecha: date = None) -> tuple[date, date]:
     return inicio, fin
 
 
+@lru_cache(maxsize=256)
 def get_month_range(anio: int, mes: int) -> tuple[date, date]:
     """
     Obtiene el rango de fechas de un mes.
@@ -65,6 +78,7 @@ def get_month_range(anio: int, mes: int) -> tuple[date, date]:
     return inicio, fin
 
 
+@lru_cache(maxsize=256)
 def get_quincena_range(anio: int, mes: int, quincena: int) -> tuple[date, date]:
     """
     Obtiene el rango de fechas de una quincena.
@@ -93,8 +107,4 @@ def get_quincena_range(anio: int, mes: int, quincena: int) -> tuple[date, date]:
 
 def format_date(fecha: date) -> str:
     """Formatea una fecha a string legible"""
-    meses = [
-        "", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-        "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
-    ]
-    return f"{fecha.day} de {meses[fecha.month]} de {fecha.year}"
+    return f"{fecha.day}{_DE_MES[fecha.month]}{fecha.year}"